@@ -0,0 +1,266 @@
+"""
+Headless benchmark of the players.
+
+Drives every media file through a Timeline and a Dispatcher like main.py does, but with a stand-in for jack.Client and
+a transport thread that plays a script of rolls, relocates and stops in real time. Videos render into an offscreen
+sink, so all this needs is the media files, no JACK server, audio hardware or display:
+
+    python -m musejack.bench video.mp4 stems.wav --seeks 10 --out bench.json
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import time
+from pathlib import Path
+from threading import Thread
+
+import numpy as np
+
+from musejack.dispatch import ROLLING, STOPPED, Dispatcher
+from musejack.display import OffscreenSink
+from musejack.metrics import METRICS
+from musejack.players import Video
+from musejack.timeline import Cue, Timeline
+
+Log = logging.getLogger(__name__)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class FakePort:
+
+    def __init__(self, name, blocksize):
+        self.name = name
+        self.buffer = np.zeros(blocksize, dtype=np.float32)
+
+    def get_array(self):
+        return self.buffer
+
+
+class FakePorts(list):
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def register(self, name):
+        port = FakePort(name, self.client.blocksize)
+        self.append(port)
+        return port
+
+
+class FakePosition:
+
+    def __init__(self):
+        self.frame = 0
+
+
+class FakeClient:
+    """
+    Stand-in for jack.Client with the parts the players use. The transport of a Bench calls the process callback every
+    period, like JACK would.
+    """
+
+    def __init__(self, samplerate=48000, blocksize=256):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.outports = FakePorts(self)
+        self.process_callback = None
+
+    def set_process_callback(self, callback):
+        self.process_callback = callback
+
+
+def default_script(duration, roll=10.0, seeks=5, seek_roll=2.0, seed=0):
+    """
+    Rolls from the start for roll seconds, then relocates seeks times to random positions, rolling seek_roll seconds
+    after each, and stops. Steps are (action, seconds) with action "roll", "locate" or "stop".
+    """
+    rng = random.Random(seed)
+    script = [("locate", 0.0), ("roll", roll)]
+    for _ in range(seeks):
+        script.append(("locate", rng.uniform(0, max(0.0, duration - seek_roll))))
+        script.append(("roll", seek_roll))
+    script.append(("stop", 0.5))
+    return script
+
+
+def thread_cpu_time(native_id, pid="self"):
+    """
+    CPU seconds used by one thread (or a whole process with native_id None), None where /proc isn't available.
+    """
+    path = f"/proc/{pid}/stat" if native_id is None else f"/proc/{pid}/task/{native_id}/stat"
+    try:
+        with open(path) as f:
+            # the command name can contain spaces, the fields we need come after its closing parenthesis
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+class Bench:
+    """
+    Plays a script against the players of one media file and collects how they kept up.
+    """
+
+    def __init__(self, path, samplerate=48000, blocksize=256, process=False):
+        self.path = path
+        self.client = FakeClient(samplerate, blocksize)
+        self.period = blocksize / samplerate
+
+        self.timeline = Timeline([Cue(path, 0, 0)], samplerate)
+        self.sink = OffscreenSink()
+        self.player = self.timeline.open_players(self.client, process=process, sinks=[self.sink])[0]
+        self.dispatcher = Dispatcher(self.timeline, samplerate, blocksize)
+
+        self.position = FakePosition()
+        self.state = STOPPED
+        self.new_pos = False
+        self.rolled = 0.0  # seconds the transport was rolling
+
+    def duration(self) -> float:
+        return self.player.total_frames / self.player.frame_rate
+
+    def _cycle(self):
+        if self.client.process_callback is not None:
+            self.client.process_callback(self.client.blocksize)
+        self.dispatcher(self.state, self.client.blocksize, self.position, self.new_pos)
+        self.new_pos = False
+        if self.state == ROLLING:
+            self.position.frame += self.client.blocksize
+            self.rolled += self.period
+
+    def _run_for(self, seconds):
+        deadline = time.perf_counter()
+        for _ in range(round(seconds / self.period)):
+            self._cycle()
+            deadline += self.period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def play(self, script):
+        for action, seconds in script:
+            if action == "locate":
+                self.position.frame = round(seconds * self.client.samplerate)
+                self.new_pos = True
+                self.state = ROLLING
+            elif action == "roll":
+                self.state = ROLLING
+                self._run_for(seconds)
+            elif action == "stop":
+                self.state = STOPPED
+                self._run_for(seconds)
+            else:
+                raise ValueError(f"Unknown script action {action}")
+
+    def run(self, script) -> dict:
+        METRICS.reset()
+        threads = {"player": self.player}
+        if isinstance(self.player, Video):
+            threads["decoder"] = self.player.decode_thread
+            threads["presenter"] = self.timeline.presenter
+        cpu_before = {name: thread_cpu_time(thread.native_id) for name, thread in threads.items()}
+        process_before, children_before = time.process_time(), _children_cpu_time()
+        wall = time.perf_counter()
+
+        transport = Thread(target=self.play, args=(script,), name="transport")
+        transport.start()
+        transport.join()
+
+        wall = time.perf_counter() - wall
+        cpu_threads = {name: thread_cpu_time(thread.native_id) for name, thread in threads.items()}
+        self.player.stop()
+        if self.timeline.presenter is not None:
+            self.timeline.presenter.stop()
+        cpu = time.process_time() - process_before + _children_cpu_time() - children_before
+        METRICS.remove_gauge(f"{self.player.name}.ring")
+
+        sync = self.player.sync
+        result = {
+            "player": self.player.name,
+            "wall": wall,
+            "rolled": self.rolled,
+            "cpu_percent": 100 * cpu / wall,
+            "cpu_threads_percent": {name: 100 * (cpu_threads[name] - cpu_before[name]) / wall
+                                    for name in threads if cpu_before[name] is not None
+                                    and cpu_threads[name] is not None},
+            "dropped": sync.dropped,
+            "held": sync.held,
+            "missed": sync.missed,
+            "late_wakeups": self.player.late_wakeups,
+            "histograms": {name: h.to_dict() for name, h in METRICS.histograms.items() if h.count},
+        }
+        if isinstance(self.player, Video):
+            result["fps"] = self.player.presented / self.rolled if self.rolled else 0.0
+            result["frame_rate"] = self.player.frame_rate
+            result["superseded"] = self.timeline.presenter.superseded
+        else:
+            result["underruns"] = self.player.ring.underruns
+        return result
+
+
+def _children_cpu_time() -> float:
+    # decoder processes only show up here once they have been joined
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def report(result) -> str:
+    histograms = result["histograms"]
+    seeks = histograms.get("video.seek") or histograms.get("audio.seek")
+    drift = histograms.get("sync.drift")
+
+    lines = [f"{result['player']}: cpu {result['cpu_percent']:.1f}%"
+             + "".join(f", {name} {percent:.1f}%" for name, percent in result["cpu_threads_percent"].items())]
+    if "fps" in result:
+        lines.append(f"  {result['fps']:.2f} of {result['frame_rate']} fps, dropped {result['dropped']}, "
+                     f"missed {result['missed']}, held {result['held']}, superseded {result['superseded']}")
+    else:
+        lines.append(f"  underruns {result['underruns']}, late wakeups {result['late_wakeups']}")
+    if seeks:
+        lines.append(f"  seek p50 {seeks['p50'] / 1000:.1f} p90 {seeks['p90'] / 1000:.1f} "
+                     f"p99 {seeks['p99'] / 1000:.1f} max {seeks['max'] / 1000:.1f} ms ({seeks['count']} seeks)")
+    if drift:
+        lines.append(f"  drift p50 {drift['p50']} p99 {drift['p99']} max {drift['max']} frames")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the MuseJack players without JACK or a display")
+    parser.add_argument("media", nargs="+", help="video or audio files to play, one after another")
+    parser.add_argument("--samplerate", type=int, default=48000, help="simulated samplerate (default: %(default)s)")
+    parser.add_argument("--blocksize", type=int, default=256, help="simulated period size (default: %(default)s)")
+    parser.add_argument("--roll", type=float, default=10.0,
+                        help="seconds to roll from the start (default: %(default)s)")
+    parser.add_argument("--seeks", type=int, default=5, help="random relocates after that (default: %(default)s)")
+    parser.add_argument("--seek-roll", type=float, default=2.0,
+                        help="seconds to roll after every relocate (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the relocate positions")
+    parser.add_argument("--decode-processes", action="store_true", help="decode videos in worker processes")
+    parser.add_argument("--out", help="also write the results to this JSON file")
+    parser.add_argument("--debug", action="store_true", help="log debug messages")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    # only the histograms, the report gets printed at the end
+    METRICS.enable(interval=math.inf)
+
+    results = []
+    for media in args.media:
+        bench = Bench(media, args.samplerate, args.blocksize, process=args.decode_processes)
+        script = default_script(bench.duration(), args.roll, args.seeks, args.seek_roll, args.seed)
+        Log.info(f"Benchmarking {Path(media).name}")
+        result = bench.run(script)
+        print(report(result))
+        results.append(result)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        Log.info(f"Wrote results to {args.out}")
@@ -0,0 +1,369 @@
+from collections import OrderedDict
+from threading import Condition, Lock
+
+import numpy as np
+
+
+class FrameRing:
+    """
+    Fixed-size ring of preallocated frames.
+
+    A single decode thread fills the ring ahead of the transport (reserve -> write into the slot -> commit), while a
+    single presentation thread picks the frame it needs (peek -> use the frame -> release). Nothing gets allocated after
+    construction, the producer writes straight into the slot arrays.
+    """
+
+    def __init__(self, capacity, shape, dtype=np.uint8, frames=None):
+        self.capacity = capacity
+        # the slots can live in memory owned by someone else, e.g. shared with a decoder process
+        self.frames = frames if frames is not None else np.zeros((capacity, *shape), dtype=dtype)
+        self.indices = np.full(capacity, -1, dtype=np.int64)  # frame index stored in every slot
+        self.depth = capacity  # slots the producer may fill ahead, tuned at runtime up to capacity
+        self.min_count = capacity  # lowest amount of buffered frames a peek found since the last reset
+
+        self.head = 0  # next slot to be presented
+        self.tail = 0  # next slot to be written
+        self.count = 0
+
+        # every seek bumps the generation, so frames that were being decoded during the seek get thrown away
+        self.generation = 0
+        self.pending_seek = -1
+        self.exhausted = False  # the producer reached the end of the file
+        self.closed = False
+
+        self.cond = Condition()
+
+    # producer side
+
+    def reserve(self):
+        """
+        Waits for a free slot. Returns (slot, generation, seek), where seek is the frame index the producer should
+        jump to before decoding (or -1). Returns (None, ...) when the ring got closed.
+        """
+        with self.cond:
+            while not self.closed and self.pending_seek == -1 and (self.count >= self.depth or self.exhausted):
+                self.cond.wait()
+            if self.closed:
+                return None, self.generation, -1
+
+            seek = self.pending_seek
+            self.pending_seek = -1
+            return self.tail, self.generation, seek
+
+    def commit(self, slot, frame_index, generation):
+        with self.cond:
+            if generation != self.generation or self.closed:
+                return  # a seek happened while we were decoding this frame
+            self.indices[slot] = frame_index
+            self.tail = (slot + 1) % self.capacity
+            self.count += 1
+            self.cond.notify_all()
+
+    def finish(self, generation):
+        """
+        Marks the end of the file, the producer will sleep until the next seek.
+        """
+        with self.cond:
+            if generation == self.generation:
+                self.exhausted = True
+                self.cond.notify_all()
+
+    # consumer side
+
+    def seek(self, frame_index):
+        """
+        Throws away every buffered frame and asks the producer to continue from frame_index.
+        """
+        with self.cond:
+            self.generation += 1
+            self.pending_seek = frame_index
+            self.head = self.tail = self.count = 0
+            self.indices.fill(-1)
+            self.exhausted = False
+            self.cond.notify_all()
+
+    def peek(self, frame_index, timeout=0.0):
+        """
+        Returns the slot holding frame_index, dropping every older frame on the way. Waits at most timeout seconds
+        for the producer to catch up, returns None when the frame isn't there (yet).
+        The slot stays owned by the consumer until release() gets called.
+        """
+        with self.cond:
+            while True:
+                while self.count and self.indices[self.head] < frame_index:
+                    self._drop()
+                if self.count < self.min_count:
+                    self.min_count = self.count
+                if self.count:
+                    if self.indices[self.head] == frame_index:
+                        return self.head
+                    return None  # the producer is already past this frame
+                if self.exhausted or self.closed or timeout <= 0:
+                    return None
+                if not self.cond.wait(timeout):
+                    return None
+                timeout = 0.0  # only wait once
+
+    def release(self):
+        with self.cond:
+            if self.count:
+                self._drop()
+
+    def _drop(self):
+        self.indices[self.head] = -1
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+        self.cond.notify_all()
+
+    def set_depth(self, depth):
+        with self.cond:
+            self.depth = max(1, min(depth, self.capacity))
+            self.min_count = self.count
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class AudioRing:
+    """
+    Single producer, single consumer ring of float32 samples, shaped (capacity, channels).
+
+    The feeder thread writes into the views returned by writable() and then calls advance(), the JACK process callback
+    copies straight from the ring into the port buffers. Both positions only ever grow and every one of them is only
+    written by one side, so no locking is needed.
+    """
+
+    def __init__(self, capacity, channels):
+        self.capacity = capacity
+        self.channels = channels
+        self.data = np.zeros((capacity, channels), dtype=np.float32)
+        self.depth = capacity  # frames the producer may buffer, tuned at runtime up to capacity
+
+        self.read_pos = 0
+        self.write_pos = 0
+        self.discard_pos = 0  # set by the producer, everything before it is stale and never gets played
+        self.finished = False  # the producer has nothing more to write, running dry is not an underrun
+        self.refilling = False  # the producer hasn't written since the last discard, running dry is not an underrun
+
+        # seeks: the consumer side counts the ones it asked for, the producer the one it last discarded for. Until they
+        # match, everything in the ring is from before the seek
+        self.wanted = 0
+        self.served = 0
+        self.origin = 0  # position in the media of the sample at discard_pos
+        self.aligned = True  # the consumer caught up with the transport since the last seek
+
+        self.underruns = 0
+        self.min_fill = capacity  # lowest fill level seen since the last reset_stats()
+
+    def fill(self) -> int:
+        return self.write_pos - max(self.read_pos, self.discard_pos)
+
+    def space(self) -> int:
+        return max(0, self.depth - self.fill())
+
+    # producer side
+
+    def writable(self):
+        """
+        Returns the contiguous free part of the ring starting at the write position (may be empty).
+        """
+        start = self.write_pos % self.capacity
+        end = min(self.capacity, start + self.space())
+        return self.data[start:end]
+
+    def advance(self, frames):
+        self.write_pos += frames
+        self.refilling = False
+
+    def finish(self):
+        self.finished = True
+
+    def discard(self, origin=0, seek=None):
+        """
+        Drops everything that was written so far, e.g. after a seek. The consumer skips over it on its next read.
+        origin is the position in the media of what gets written next. For seek, a number returned by request_seek,
+        the consumer also skips whatever the transport passed since then.
+        """
+        self.discard_pos = self.write_pos
+        self.origin = origin
+        self.finished = False
+        self.refilling = True
+        if seek is not None:
+            self.aligned = False
+            self.served = seek
+
+    def resize(self, capacity):
+        """
+        Reallocates the ring with a new capacity, keeping as much of the unread samples as fits. Neither side may use
+        the ring meanwhile, e.g. while JACK changes the period size it doesn't run the process callback.
+        """
+        # when the new ring is too small, the oldest samples (the ones that would be played first) get dropped
+        kept = min(self.fill(), capacity)
+        samples = self.data[np.arange(self.write_pos - kept, self.write_pos) % self.capacity]
+
+        self.capacity = capacity
+        self.depth = min(self.depth, capacity)
+        self.data = np.zeros((capacity, self.channels), dtype=np.float32)
+        self.read_pos = self.discard_pos = self.write_pos - kept
+        self.data[np.arange(self.read_pos, self.write_pos) % capacity] = samples
+        self.min_fill = min(self.min_fill, capacity)
+
+    # consumer side
+
+    def request_seek(self) -> int:
+        """
+        Silences the ring until the producer discarded for this seek, returns the number to pass to discard.
+        """
+        self.wanted += 1
+        return self.wanted
+
+    def read_into(self, outputs, frames, at=0) -> int:
+        """
+        Copies frames samples of every channel into outputs (one writable array per channel), zero-filling whatever
+        the ring doesn't have. Returns the amount of frames that were actually available. at is where in the media
+        the transport is, the first read after a seek starts there.
+        """
+        if self.served != self.wanted:
+            return self._silence(outputs, frames)  # the producer didn't get to the seek yet, all of this is stale
+        if self.discard_pos > self.read_pos:
+            self.read_pos = self.discard_pos
+
+        if not self.aligned:
+            # the transport moved on while the producer seeked, skip what it passed and wait for a full block
+            behind = at - (self.origin + self.read_pos - self.discard_pos)
+            skip = min(max(behind, 0), self.fill())
+            self.read_pos += skip
+            if behind > skip or self.fill() < frames and not self.finished:
+                return self._silence(outputs, frames)
+            self.aligned = True
+
+        fill = self.fill()
+        if fill < self.min_fill:
+            self.min_fill = fill
+        available = min(frames, fill)
+        if available < frames and not self.finished and not self.refilling:
+            self.underruns += 1
+
+        start = self.read_pos % self.capacity
+        first = min(available, self.capacity - start)
+        for channel, out in enumerate(outputs):
+            out[:first] = self.data[start:start + first, channel]
+            out[first:available] = self.data[:available - first, channel]
+            out[available:frames] = 0
+        self.read_pos += available
+        return available
+
+    @staticmethod
+    def _silence(outputs, frames) -> int:
+        for out in outputs:
+            out[:frames] = 0
+        return 0
+
+    def reset_stats(self):
+        self.underruns = 0
+        self.min_fill = self.capacity
+
+
+class DepthTuner:
+    """
+    Picks the depth of a ring from how the machine keeps up, instead of hand tuning latency against stability.
+
+    Every interval the owner reports whether the ring ran dry and how much of the depth was left at its lowest. Running
+    dry doubles the depth right away, a ring that never dropped below half its depth for shrink_after seconds gives
+    up one step.
+    """
+
+    def __init__(self, depth, minimum, maximum, interval=1.0, shrink_after=30.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.depth = max(minimum, min(depth, maximum))
+        self.interval = interval
+        self.shrink_after = shrink_after
+
+        self.next_check = 0.0
+        self.calm_since = None
+
+    def due(self, now) -> bool:
+        return now >= self.next_check
+
+    def update(self, now, starved, lowest) -> int:
+        """
+        Returns the new depth, starved tells whether the ring ran dry since the last update and lowest is the lowest
+        fill since then, in the same unit as the depth.
+        """
+        self.next_check = now + self.interval
+        if starved:
+            self.depth = min(self.maximum, self.depth * 2)
+            self.calm_since = None
+        elif lowest * 2 >= self.depth:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= self.shrink_after and self.depth > self.minimum:
+                self.depth -= 1
+                self.calm_since = now
+        else:
+            self.calm_since = None
+        return self.depth
+
+
+class FrameCache:
+    """
+    Least recently used cache of decoded, scaled frames keyed by (file, frame index), shared by every Video player and
+    limited to budget bytes. Evicted frames are recycled for new entries, so a warm cache stops allocating.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.frames = OrderedDict()
+        self.size = 0
+        self.spare = []
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = Lock()
+
+    def get_into(self, path, index, out) -> bool:
+        """
+        Copies the cached frame into out, returns False on a miss.
+        """
+        with self.lock:
+            frame = self.frames.get((path, index))
+            if frame is None:
+                self.misses += 1
+                return False
+            self.frames.move_to_end((path, index))
+            self.hits += 1
+            np.copyto(out, frame)
+            return True
+
+    def put(self, path, index, frame):
+        if frame.nbytes > self.budget:
+            return
+        with self.lock:
+            if (path, index) in self.frames:
+                self.frames.move_to_end((path, index))
+                return
+
+            while self.size + frame.nbytes > self.budget:
+                _, evicted = self.frames.popitem(last=False)
+                self.size -= evicted.nbytes
+                if len(self.spare) < 4:
+                    self.spare.append(evicted)
+
+            copy = next((spare for spare in self.spare if spare.shape == frame.shape), None)
+            if copy is None:
+                copy = np.empty_like(frame)
+            else:
+                self.spare.remove(copy)
+            np.copyto(copy, frame)
+
+            self.frames[(path, index)] = copy
+            self.size += copy.nbytes
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
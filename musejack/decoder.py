@@ -0,0 +1,171 @@
+import logging
+import time
+from multiprocessing import Pipe, Process
+from multiprocessing.shared_memory import SharedMemory
+from threading import Thread
+
+import cv2
+import numpy as np
+
+from musejack.keyframes import KeyframeIndex
+
+Log = logging.getLogger(__name__)
+
+
+class Decoder:
+    """
+    Decodes the frames of one video straight into the slots of a frame ring, scaled to the size of those slots.
+
+    A Video uses it from its decode thread, or runs it in a worker process through RemoteDecoder.
+    """
+
+    def __init__(self, path, frames, frame_rate, vcap=None):
+        self.path = path
+        self.frames = frames
+        self.size = (frames.shape[2], frames.shape[1])
+        self.frame_rate = frame_rate
+
+        # path we're decoding from, the source file or its proxy once that's ready
+        self.source = path
+        self.vcap = vcap if vcap is not None else cv2.VideoCapture(path)
+        self.vcap_frame = 0  # next frame vcap will return
+
+        # vcap.read decodes into this buffer instead of allocating a new frame every time
+        self.decode_buffer = None
+
+        # the keyframe index gets loaded (or built) in the background, until then seeks fall back to opencv
+        self.keyframes = None
+
+    def start(self):
+        Thread(target=self._load_keyframes, daemon=True).start()
+
+    def _load_keyframes(self):
+        try:
+            keyframes = KeyframeIndex.open(self.path)
+        except OSError as e:
+            Log.warning(f"Couldn't index keyframes of {self.path}: {e}")
+            return
+        if self.source == self.path:  # we might have switched to the proxy already
+            self.keyframes = keyframes
+
+    def use_source(self, path, keyframes=None) -> bool:
+        """
+        Switches decoding over to another file with the same frames, e.g. a proxy. Returns False (and keeps decoding
+        the current file) when it can't be opened.
+        """
+        vcap = cv2.VideoCapture(path)
+        if not vcap.isOpened():
+            Log.warning(f"Couldn't open {path}, staying on {self.source}")
+            return False
+        vcap.set(cv2.CAP_PROP_POS_FRAMES, self.vcap_frame)  # carry on where the old file was
+
+        self.vcap.release()
+        self.vcap = vcap
+        self.keyframes = keyframes if keyframes is not None else KeyframeIndex.open(path)
+        self.source = path
+        return True
+
+    def decode(self, slot, index):
+        """
+        Decodes frame index into ring slot, moving vcap there first if it's somewhere else.
+        Returns (decoded, decode time, resize time).
+        """
+        if self.vcap_frame != index:
+            self._skip_to(index)
+
+        start = time.perf_counter()
+        ret, frame = self.vcap.read(self.decode_buffer)
+        if not ret:
+            return False, 0.0, 0.0
+        self.vcap_frame += 1
+        self.decode_buffer = frame  # opencv only reallocates when the size changes, e.g. switching to a proxy
+        decoded = time.perf_counter()
+
+        target = self.frames[slot]
+        if frame.shape == target.shape:
+            np.copyto(target, frame)  # proxies are decoded at the right size already
+        else:
+            cv2.resize(frame, self.size, dst=target, interpolation=cv2.INTER_CUBIC)
+        return True, decoded - start, time.perf_counter() - decoded
+
+    def _skip_to(self, target):
+        if self.keyframes is not None:
+            # jump to the keyframe before the target, unless decoding forward from where we are is shorter
+            keyframe = self.keyframes.keyframe_before(target)
+            if not keyframe <= self.vcap_frame <= target:
+                self.vcap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+                self.vcap_frame = keyframe
+        elif not self.vcap_frame <= target <= self.vcap_frame + self.frame_rate:
+            # without an index we only decode forward over short distances
+            self.vcap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            self.vcap_frame = target
+
+        # grab() decodes without converting the frame, which is all we need to get to the target
+        while self.vcap_frame < target and self.vcap.grab():
+            self.vcap_frame += 1
+        self.vcap_frame = target
+
+    def close(self):
+        self.vcap.release()
+
+
+class RemoteDecoder:
+    """
+    Runs a Decoder in a worker process, so decoding and scaling don't compete with the JACK callbacks for the GIL.
+
+    The ring slots live in shared memory, the worker writes the frames straight into them. Only the small
+    (command, slot, frame) messages go through the pipe, frames never get pickled.
+    """
+
+    def __init__(self, path, shape, frame_rate):
+        self.path = path
+        self.shm = SharedMemory(create=True, size=int(np.prod(shape)))
+        self.frames = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+
+        self.conn, worker_conn = Pipe()
+        self.process = Process(target=_worker, args=(worker_conn, path, self.shm.name, shape, frame_rate),
+                               daemon=True)
+
+    def start(self):
+        self.process.start()
+
+    def decode(self, slot, index):
+        self.conn.send(("decode", slot, index))
+        return self.conn.recv()
+
+    def use_source(self, path, keyframes=None) -> bool:
+        self.conn.send(("source", path))  # the worker loads the keyframes itself
+        return self.conn.recv()
+
+    def close(self):
+        try:
+            self.conn.send(("close",))
+        except OSError:
+            pass  # the worker is gone already
+        self.process.join(timeout=2)
+        self.shm.unlink()
+
+
+def _worker(conn, path, shm_name, shape, frame_rate):
+    shm = SharedMemory(name=shm_name)
+    frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    decoder = Decoder(path, frames, frame_rate)
+    decoder.start()
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "decode":
+                conn.send(decoder.decode(message[1], message[2]))
+            elif message[0] == "source":
+                conn.send(decoder.use_source(message[1]))
+            else:
+                break
+    except EOFError:
+        pass  # the player process went away
+    finally:
+        decoder.close()
+        del frames, decoder
+        try:
+            shm.close()
+        except BufferError:
+            pass  # the keyframe thread still holds the decoder, the mapping goes away with the process
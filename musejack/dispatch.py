@@ -0,0 +1,240 @@
+import logging
+import time
+from threading import Event, Thread
+
+from musejack.metrics import METRICS
+from musejack.players import realtime
+
+Log = logging.getLogger(__name__)
+
+# JACK transport states, the same values as jack.STOPPED and ROLLING, so following the transport doesn't need
+# libjack to be importable (the bench runs without it)
+STOPPED = 0
+ROLLING = 1
+
+# kinds of notifications the realtime callback hands to the reporter thread
+STATE_CHANGED = 1
+RELOCATED = 2
+OVER_BUDGET = 3
+LEFT = 4  # where the transport was when it relocated, comes right before the RELOCATED
+LOCATED = 5  # relocated while stopped
+
+CALLBACK_TIME = METRICS.histogram("jack.callback")
+
+
+class Dispatcher:
+    """
+    Timebase callback that forwards the JACK transport to the timeline.
+
+    The callback itself never logs or builds strings: everything worth reporting is written into a preallocated ring
+    of (kind, value) pairs, which a reporter thread drains and logs. The callback also times itself and reports every
+    cycle that takes longer than budget (a share of the period).
+
+    on_relocate(from_frame, to_frame) gets called from the reporter thread after every relocate while rolling.
+    """
+
+    def __init__(self, timeline, samplerate, blocksize, budget=0.25, capacity=256):
+        self.timeline = timeline
+        self.budget = budget
+        self.blocksize = blocksize
+        self.period = blocksize / samplerate
+        self.budget_seconds = budget * self.period
+
+        self.state = -1
+        self.frame = 0  # transport frame the next cycle should have, if nothing relocates
+        self.on_relocate = None
+        self.left = 0  # only touched by the reporter
+        self.over_budget = 0
+        self.worst_cycle = 0.0
+
+        # notification ring, only written by the callback and only read by the reporter
+        self.capacity = capacity
+        self.kinds = [0] * capacity
+        self.values = [0] * capacity
+        self.write_pos = 0
+        self.read_pos = 0
+        self.dropped = 0
+
+        self.stopped = Event()
+        self.reporter = Thread(target=self._report_loop, daemon=True)
+
+    def set_period(self, samplerate, blocksize):
+        self.blocksize = blocksize
+        self.period = blocksize / samplerate
+        self.budget_seconds = self.budget * self.period
+
+    @realtime
+    def __call__(self, state: int, blocksize: int, position, new_pos: bool) -> None:
+        start = time.perf_counter()
+        frame = position.frame
+
+        if state != self.state:
+            if state == ROLLING:
+                self.timeline.seek(frame)
+            else:
+                self.timeline.pause()
+            self.state = state
+            self._notify(STATE_CHANGED, state)
+        elif new_pos and state == ROLLING:
+            # relocated while rolling
+            self.timeline.seek(frame)
+            self._notify(LEFT, self.frame)
+            self._notify(RELOCATED, frame)
+        elif state == ROLLING:
+            self.timeline.step(frame)
+        elif new_pos:
+            # the playhead moved while stopped, the picture follows but nothing starts playing
+            self.timeline.locate(frame)
+            self._notify(LOCATED, frame)
+        # stopped cycles (a Follower sees every one of them) leave the players where they are
+        self.frame = frame + blocksize if state == ROLLING else frame
+
+        elapsed = time.perf_counter() - start
+        CALLBACK_TIME.record(elapsed)
+        if elapsed > self.worst_cycle:
+            self.worst_cycle = elapsed
+        if elapsed > self.budget_seconds:
+            self.over_budget += 1
+            self._notify(OVER_BUDGET, elapsed)
+
+    @realtime
+    def transport_stopped(self, state):
+        """
+        Pauses the timeline if it still rolls, for stops the timebase callback doesn't get called for.
+        """
+        if self.state == ROLLING:
+            self.timeline.pause()
+            self.state = state
+            self._notify(STATE_CHANGED, state)
+
+    @realtime
+    def _notify(self, kind, value):
+        if self.write_pos - self.read_pos >= self.capacity:
+            self.dropped += 1
+            return
+        slot = self.write_pos % self.capacity
+        self.kinds[slot] = kind
+        self.values[slot] = value
+        self.write_pos += 1
+
+    def start(self):
+        self.reporter.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.reporter.join()
+        self.drain()
+
+    def drain(self):
+        while self.read_pos < self.write_pos:
+            slot = self.read_pos % self.capacity
+            kind, value = self.kinds[slot], self.values[slot]
+            self.read_pos += 1
+
+            if kind == STATE_CHANGED:
+                Log.debug(f"new state {value}")
+            elif kind == LOCATED:
+                Log.debug(f"located to audio frame {value} while stopped")
+            elif kind == LEFT:
+                self.left = value
+            elif kind == RELOCATED:
+                Log.debug(f"relocated to audio frame {value}")
+                if self.on_relocate is not None:
+                    self.on_relocate(self.left, value)
+            elif kind == OVER_BUDGET:
+                Log.warning(f"timebase callback took {value * 1000:.3f} ms, "
+                            f"over the budget of {self.budget_seconds * 1000:.3f} ms")
+
+        if self.dropped:
+            Log.warning(f"dropped {self.dropped} notifications from the timebase callback")
+            self.dropped = 0
+
+    def _report_loop(self):
+        while not self.stopped.wait(0.1):
+            self.drain()
+
+
+class StopDetector:
+    """
+    Process callback for when we're timebase master. JACK only calls the timebase callback while the transport rolls
+    or after a relocate, so a plain stop never reaches the Dispatcher that way and the stems would play out their
+    rings. This checks the transport state every cycle and hands a stop to the Dispatcher right away.
+
+    Like with a Follower, the process callback this replaces (the mixer's) gets called after it.
+    """
+
+    def __init__(self, client, dispatcher, chained=None):
+        self.client = client
+        self.dispatcher = dispatcher
+        self.chained = chained
+
+    @realtime
+    def process(self, frames):
+        state, _ = self.client.transport_query_struct()  # realtime safe, and a plain int like the callback gets
+        if state != ROLLING:
+            self.dispatcher.transport_stopped(state)
+
+        if self.chained is not None:
+            self.chained(frames)
+
+
+class TransportClock:
+    """
+    When the current JACK cycle started, in perf_counter seconds, so player threads can tell where the transport is
+    between two cycles. Kept up to date by a Follower.
+    """
+
+    def __init__(self, samplerate, blocksize):
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.cycle_time = 0.0
+
+    def elapsed_frames(self) -> float:
+        """
+        JACK frames since the start of the current cycle.
+        """
+        return (time.perf_counter() - self.cycle_time) * self.samplerate
+
+
+class Follower:
+    """
+    Follows the JACK transport from the process callback instead of being timebase master, so MuseScore (or any other
+    client) can keep that role.
+
+    Every cycle it queries the transport, which is realtime safe and gives the position at the start of the cycle,
+    and hands it to the Dispatcher like the timebase callback would. Relocates are whatever doesn't continue where the
+    last cycle ended. The frame times of the cycle go into a TransportClock, players use it to present their frames at
+    the exact moment within the period instead of at the start of the next one.
+
+    There is only one process callback per client, the one this replaces (the mixer's) gets called after it. The
+    position handed over is the one of this cycle, while a timebase callback gets the next one: after a start or a
+    relocate the stems are silent for the cycle the seek was asked in and start at the next one, see Audio.seek.
+    """
+
+    def __init__(self, client, dispatcher, chained=None):
+        self.client = client
+        self.dispatcher = dispatcher
+        self.chained = chained
+        self.clock = TransportClock(client.samplerate, client.blocksize)
+        self.expected = -1  # where the next cycle starts unless the transport relocates
+
+    @realtime
+    def process(self, frames):
+        client = self.client
+        state, position = client.transport_query_struct()
+        clock = self.clock
+        samplerate = position.frame_rate or clock.samplerate
+        cycle_time = time.perf_counter() - (client.frame_time - client.last_frame_time) / samplerate
+
+        rolling = state == ROLLING
+        self.dispatcher(state, frames, position, position.frame != self.expected)
+        self.expected = position.frame + frames if rolling else position.frame
+
+        # only now, a player extrapolating from the new cycle start and the old position would think it's early
+        clock.samplerate = samplerate
+        clock.blocksize = frames
+        clock.cycle_time = cycle_time
+
+        if self.chained is not None:
+            self.chained(frames)
+
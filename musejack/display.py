@@ -0,0 +1,46 @@
+import cv2
+
+
+class WindowSink:
+    """
+    Shows frames in an OpenCV window, at the size of the frames or scaled to size. Only the Presenter thread may use
+    it, HighGUI windows belong to the thread that created them.
+    """
+
+    def __init__(self, name="output", size=None, fullscreen=False):
+        self.name = name
+        self.size = size  # (width, height), None shows frames as they come
+        self.fullscreen = fullscreen
+        self.opened = False
+
+    def _open(self):
+        cv2.namedWindow(self.name, cv2.WINDOW_NORMAL if self.fullscreen else cv2.WINDOW_AUTOSIZE)
+        if self.fullscreen:
+            cv2.setWindowProperty(self.name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+        self.opened = True
+
+    def show(self, frame):
+        if not self.opened:
+            self._open()
+        cv2.imshow(self.name, frame)  # painted once the presenter runs the HighGUI event loop
+
+    def close(self):
+        if self.opened:
+            cv2.destroyWindow(self.name)
+            self.opened = False
+
+
+class OffscreenSink:
+    """
+    Takes frames without showing them, for running without a display. Only counts what it got.
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self.shown = 0
+
+    def show(self, frame):
+        self.shown += 1
+
+    def close(self):
+        pass
@@ -0,0 +1,371 @@
+"""
+Offline export of the synced picture and the score's audio into one review file.
+
+JACK runs in freewheel mode meanwhile, so it starts every next cycle as soon as all clients are done with the last one:
+MuseScore renders the score as fast as it can, and the export process callback takes its audio from our input ports
+together with the position of the transport. The callback only copies, decoding the picture, mixing in the audio cues
+and encoding happen in batches on a worker thread. When the worker falls behind, the callback waits for it, which in
+freewheel mode simply slows the whole graph down to the speed of the encoder.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import time
+from pathlib import Path
+from queue import Empty, Queue
+from threading import Event, Thread
+
+import cv2
+import jack
+import numpy as np
+
+from musejack.decoder import Decoder
+from musejack.mixer import db_to_gain
+from musejack.pcmcache import PcmReader
+from musejack.players import Audio, Video
+from musejack.timeline import AUDIO_EXTENSIONS
+
+Log = logging.getLogger(__name__)
+
+# how often a callback waiting for a free batch checks whether the worker failed
+FREE_POLL = 0.5
+
+
+class ExportBatch:
+    """
+    A stretch of the export: the captured audio from transport frame start on, and the pictures that fall into it as
+    (video, export frame) pairs, video being (path, position in the media in JACK frames) or None for black.
+    """
+
+    def __init__(self, capacity, channels):
+        self.audio = np.zeros((capacity, channels), dtype=np.float32)
+        self.start = 0
+        self.filled = 0
+        self.pictures = []
+
+    def reset(self, start):
+        self.start = start
+        self.filled = 0
+        self.pictures.clear()
+
+    def end(self) -> int:
+        return self.start + self.filled
+
+
+class PictureReader:
+    """
+    Decodes the frames of one video for the export, at the export size, with the Decoder the Video players use.
+    """
+
+    def __init__(self, path, size, samplerate):
+        vcap = Video.open_source(path)
+        frame_rate = round(vcap.get(cv2.CAP_PROP_FPS))  # like the Video players
+        self.decoder = Decoder(path, np.zeros((1, size[1], size[0], 3), dtype=np.uint8), frame_rate, vcap)
+        self.decoder.start()
+        self.jack_frames_per_frame = samplerate / frame_rate
+        self.index = -1  # frame in slot 0, export frame rates above the video's show frames more than once
+
+    def read(self, media_frame):
+        """
+        Frame of the video at media_frame (in JACK frames), None past its end.
+        """
+        index = int(media_frame // self.jack_frames_per_frame)
+        if index != self.index:
+            ok, _, _ = self.decoder.decode(0, index)
+            if not ok:
+                return None
+            self.index = index
+        return self.decoder.frames[0]
+
+    def close(self):
+        self.decoder.close()
+
+
+class Exporter:
+    """
+    Renders start to end seconds of a Timeline, picture and audio, into out_path while JACK freewheels.
+
+    The score's audio comes in on the channels input ports, connect MuseScore's outputs to them (see connect). Audio
+    cues of the timeline are mixed in like the Mixer plays them: at the gain in dB gains has for their file name, or
+    unity, and left out when the name is in muted. Picture gets encoded at size and frame_rate, by default the rate of
+    the first video. Needs ffmpeg on the PATH.
+    """
+
+    def __init__(self, client, timeline, out_path, size=(1280, 720), frame_rate=None, start=None, end=None,
+                 channels=2, burn_in=False, batch_seconds=1.0, batches=4, gains=None, muted=()):
+        self.ffmpeg = shutil.which("ffmpeg")
+        if self.ffmpeg is None:
+            raise OSError("exporting needs ffmpeg on the PATH")
+
+        self.client = client
+        self.timeline = timeline
+        self.out_path = Path(out_path)
+        self.size = size
+        self.samplerate = client.samplerate
+        self.channels = channels
+        self.gains = {name: db_to_gain(db) for name, db in (gains or {}).items()}
+        self.muted = set(muted)
+
+        videos = [path for path in timeline.paths if Path(path).suffix.lower() not in AUDIO_EXTENSIONS]
+        if frame_rate is None:
+            frame_rate = 25.0
+            if videos:
+                vcap = Video.open_source(videos[0])
+                frame_rate = round(vcap.get(cv2.CAP_PROP_FPS))
+                vcap.release()
+        self.frame_rate = frame_rate
+
+        first = timeline.starts[0] if len(timeline.starts) else 0
+        self.start_frame = round(start * self.samplerate) if start is not None else int(first)
+        self.end_frame = round(end * self.samplerate) if end is not None else self._timeline_end()
+        if self.end_frame <= self.start_frame:
+            raise ValueError(f"Nothing to export between frames {self.start_frame} and {self.end_frame}")
+
+        self.ports = [client.inports.register(f"export_{channel + 1}") for channel in range(channels)]
+
+        # batches go back and forth between the callback and the worker, so the callback never allocates one
+        blocksize = client.blocksize
+        capacity = -(-round(batch_seconds * self.samplerate) // blocksize) * blocksize
+        self.free = Queue()
+        for _ in range(batches):
+            self.free.put(ExportBatch(capacity, channels))
+        self.queue = Queue()
+        self.batch = None
+        self.picture = 0  # next export frame to schedule
+        self.expected = None  # transport frame of the next cycle, unless it relocates
+        self.finished = Event()
+
+        # worker state
+        self.pictures = {}
+        self.stems = {}
+        self.canvas = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        self.burn_in = None
+        if burn_in:
+            from musejack.overlays import TimecodeOverlay
+            self.burn_in = TimecodeOverlay(round(frame_rate))
+        self.written = 0  # JACK frames of audio written
+        self.error = None  # what stopped the worker, raised again by run
+        self.worker = Thread(target=self._encode_loop, daemon=True, name="export")
+
+        client.set_process_callback(self.process)
+
+    def _timeline_end(self) -> int:
+        """
+        Transport frame where the media of the last cue group runs out.
+        """
+        if not len(self.timeline.starts):
+            return 0
+        last = len(self.timeline.starts) - 1
+        end = int(self.timeline.starts[last])
+        for i in self.timeline.group(last):
+            path = self.timeline.paths[i]
+            if Path(path).suffix.lower() in AUDIO_EXTENSIONS:
+                with Audio.open_source(path) as sf:
+                    length = sf.frames * self.samplerate / sf.samplerate
+            else:
+                vcap = Video.open_source(path)
+                length = vcap.get(cv2.CAP_PROP_FRAME_COUNT) / vcap.get(cv2.CAP_PROP_FPS) * self.samplerate
+                vcap.release()
+            end = max(end, int(self.timeline.starts[i] - self.timeline.offsets[i] + length))
+        return end
+
+    def connect(self, pattern="mscore"):
+        """
+        Connects the audio outputs of the JACK clients matching pattern (MuseScore registers as mscore) to the export
+        inputs. Mono sources go to every input.
+        """
+        sources = self.client.get_ports(pattern, is_audio=True, is_output=True)
+        if not sources:
+            Log.warning(f"No JACK outputs match {pattern}, the export will only have the audio cues")
+        for i, source in enumerate(sources):
+            targets = self.ports if len(sources) == 1 else [self.ports[i % self.channels]]
+            for target in targets:
+                self.client.connect(source, target)
+
+    def process(self, frames):
+        """
+        Process callback. Only freewheeling makes blocking here fine, it waits for the worker when all batches are in
+        use.
+        """
+        if self.finished.is_set():
+            return
+        state, position = self.client.transport_query_struct()
+        frame = position.frame
+        if state != jack.ROLLING or not self.start_frame <= frame < self.end_frame:
+            return
+
+        batch = self.batch
+        if batch is not None and (frame != batch.end() or batch.filled + frames > len(batch.audio)):
+            self._flush()
+        if self.batch is None:
+            batch = self._free_batch()
+            if batch is None:
+                return  # the worker failed, run raises its error
+            self.batch = batch
+            batch.reset(frame)
+        if frame != self.expected:
+            # first cycle or relocated, carry on with the picture that's due here
+            self.picture = int(np.ceil((frame - self.start_frame) * self.frame_rate / self.samplerate))
+
+        count = min(frames, self.end_frame - frame)
+        self.expected = frame + count
+        audio = batch.audio[batch.filled:batch.filled + count]
+        for channel, port in enumerate(self.ports):
+            audio[:, channel] = port.get_array()[:count]
+        batch.filled += count
+
+        # pictures due in this period
+        while True:
+            at = self.start_frame + round(self.picture * self.samplerate / self.frame_rate)
+            if at >= frame + count:
+                break
+            batch.pictures.append((self._video_at(at), self.picture))
+            self.picture += 1
+
+        if frame + count >= self.end_frame:
+            self._flush()
+            self.queue.put(None)
+            self.finished.set()
+
+    def _free_batch(self):
+        while self.error is None:
+            try:
+                return self.free.get(timeout=FREE_POLL)
+            except Empty:
+                pass
+        return None
+
+    def _flush(self):
+        self.queue.put(self.batch)
+        self.batch = None
+
+    def _video_at(self, jack_frame):
+        index = self.timeline.resolve(jack_frame)
+        for i in reversed(self.timeline.group(index)):
+            path = self.timeline.paths[i]
+            if Path(path).suffix.lower() not in AUDIO_EXTENSIONS:
+                return path, self.timeline.media_frame(i, jack_frame)
+        return None
+
+    def run(self, progress_interval=5.0):
+        """
+        Plays start to end in freewheel mode and writes the export. The client has to be active.
+        """
+        tmp_video = self.out_path.with_name(self.out_path.stem + ".video.tmp.mkv")
+        tmp_audio = self.out_path.with_name(self.out_path.stem + ".audio.tmp.wav")
+        import soundfile
+        self.wav = soundfile.SoundFile(str(tmp_audio), "w", self.samplerate, self.channels, "FLOAT")
+        width, height = self.size
+        self.encoder = subprocess.Popen(
+            [self.ffmpeg, "-v", "error", "-y", "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}",
+             "-r", str(self.frame_rate), "-i", "-", "-c:v", "libx264", "-preset", "veryfast", "-crf", "20",
+             "-pix_fmt", "yuv420p", str(tmp_video)], stdin=subprocess.PIPE)
+        self.worker.start()
+
+        start = time.perf_counter()
+        seconds = (self.end_frame - self.start_frame) / self.samplerate
+        Log.info(f"Exporting {seconds:.1f} s to {self.out_path}")
+        self.client.transport_stop()
+        self.client.transport_frame = self.start_frame
+        self.client.set_freewheel(True)
+        try:
+            self.client.transport_start()
+            while not self.finished.wait(progress_interval):
+                done = self.written / self.samplerate
+                Log.info(f"Exported {done:.1f} of {seconds:.1f} s, "
+                         f"{done / (time.perf_counter() - start):.1f}x realtime")
+        finally:
+            self.client.transport_stop()
+            self.client.set_freewheel(False)
+            if not self.finished.is_set():
+                self.finished.set()
+                self.queue.put(None)
+            self.worker.join()
+            try:
+                self.encoder.stdin.close()
+            except BrokenPipeError:
+                pass  # ffmpeg quit early, its return code tells
+            self.encoder.wait()
+            self.wav.close()
+
+        try:
+            if self.error is not None:
+                raise self.error
+            if self.encoder.returncode:
+                raise OSError(f"ffmpeg couldn't encode the picture of {self.out_path}")
+            self._mux(tmp_video, tmp_audio)
+        finally:
+            for tmp in (tmp_video, tmp_audio):
+                if tmp.exists():
+                    os.remove(tmp)
+        elapsed = time.perf_counter() - start
+        Log.info(f"Exported {self.out_path} in {elapsed:.1f} s, {seconds / elapsed:.1f}x realtime")
+
+    def _mux(self, video, audio):
+        result = subprocess.run([self.ffmpeg, "-v", "error", "-y", "-i", str(video), "-i", str(audio), "-map", "0:v",
+                                 "-map", "1:a", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k", str(self.out_path)])
+        if result.returncode:
+            raise OSError(f"ffmpeg couldn't write {self.out_path}")
+
+    def _encode_loop(self):
+        try:
+            while True:
+                batch = self.queue.get()
+                if batch is None:
+                    break
+                self._mix_stems(batch)
+                self.wav.write(batch.audio[:batch.filled])
+                self.written += batch.filled
+                for video, export_frame in batch.pictures:
+                    self.encoder.stdin.write(self._draw(video, export_frame))
+                self.free.put(batch)
+        except Exception as e:
+            # e.g. a BrokenPipeError when ffmpeg quits, stop the callback and the export instead of waiting forever
+            Log.error(f"Exporting {self.out_path} failed: {e!r}")
+            self.error = e
+            self.finished.set()
+        finally:
+            for reader in [*self.pictures.values(), *self.stems.values()]:
+                reader.close()
+
+    def _draw(self, video, export_frame):
+        frame = None
+        if video is not None:
+            path, media_frame = video
+            if path not in self.pictures:
+                self.pictures[path] = PictureReader(path, self.size, self.samplerate)
+            frame = self.pictures[path].read(media_frame)
+        if frame is None:
+            self.canvas.fill(0)
+        else:
+            np.copyto(self.canvas, frame)
+        if self.burn_in:
+            self.burn_in.draw(self.canvas, export_frame)
+        return self.canvas.data
+
+    def _mix_stems(self, batch):
+        timeline = self.timeline
+        position, end = batch.start, batch.end()
+        while position < end:
+            index = timeline.resolve(position)
+            until = end
+            if index + 1 < len(timeline.starts):
+                until = min(end, int(timeline.starts[index + 1]))
+            out = batch.audio[position - batch.start:until - batch.start]
+            for i in timeline.group(index):
+                path = timeline.paths[i]
+                name = Path(path).name
+                if Path(path).suffix.lower() not in AUDIO_EXTENSIONS or name in self.muted:
+                    continue
+                if path not in self.stems:
+                    self.stems[path] = PcmReader(path, self.samplerate)
+                block = self.stems[path].read(timeline.media_frame(i, position), len(out))
+                if name in self.gains:
+                    block = block * self.gains[name]
+                if block.shape[1] == 1:
+                    out += block  # mono stems go to every channel
+                else:
+                    out[:, :min(block.shape[1], self.channels)] += block[:, :self.channels]
+            position = until
@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+from bisect import bisect_right
+from pathlib import Path
+
+import cv2
+
+from musejack.util import file_fingerprint
+
+Log = logging.getLogger(__name__)
+
+# bump this when the layout of the sidecar file changes
+INDEX_VERSION = 1
+SIDECAR_SUFFIX = ".mjkidx"
+
+
+class KeyframeIndex:
+    """
+    Sorted list of the keyframe positions (in frames) of a video file.
+
+    Building the index reads the packets of the file without decoding them, the result gets cached in a sidecar file
+    next to the video, keyed by the fingerprint and modification time of the video.
+    """
+
+    def __init__(self, path, keyframes, total_frames):
+        self.path = Path(path)
+        self.keyframes = keyframes
+        self.total_frames = total_frames
+
+    def keyframe_before(self, frame) -> int:
+        """
+        Returns the last keyframe at or before frame.
+        """
+        i = bisect_right(self.keyframes, frame)
+        return self.keyframes[i - 1] if i else 0
+
+    @staticmethod
+    def sidecar_path(path) -> Path:
+        path = Path(path)
+        return path.with_name(path.name + SIDECAR_SUFFIX)
+
+    @staticmethod
+    def open(path):
+        """
+        Loads the index from the sidecar file, or builds (and caches) it when the sidecar is missing or stale.
+        Returns None if the keyframes of this file can't be determined.
+        """
+        fingerprint = file_fingerprint(path)
+        mtime = os.path.getmtime(path)
+
+        index = KeyframeIndex.load(path, fingerprint, mtime)
+        if index is None:
+            index = KeyframeIndex.build(path)
+            if index is not None:
+                index.save(fingerprint, mtime)
+        return index
+
+    @staticmethod
+    def load(path, fingerprint, mtime):
+        sidecar = KeyframeIndex.sidecar_path(path)
+        try:
+            with open(sidecar) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("version") != INDEX_VERSION or data.get("hash") != fingerprint or data.get("mtime") != mtime:
+            Log.debug(f"Keyframe index {sidecar} is stale")
+            return None
+        return KeyframeIndex(path, data["keyframes"], data["frames"])
+
+    @staticmethod
+    def build(path):
+        if not hasattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME"):
+            Log.warning("This OpenCV build can't report keyframes, seeking will be slower")
+            return None
+
+        vcap = cv2.VideoCapture(str(path), cv2.CAP_FFMPEG)
+        try:
+            # read raw packets, we only need the keyframe flags so there is no point in decoding
+            if not vcap.isOpened() or not vcap.set(cv2.CAP_PROP_FORMAT, -1):
+                return None
+
+            keyframes = []
+            frame = 0
+            while vcap.grab():
+                if vcap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keyframes.append(frame)
+                frame += 1
+        finally:
+            vcap.release()
+
+        if not keyframes:
+            return None
+        Log.info(f"Indexed {len(keyframes)} keyframes in {frame} frames of {path}")
+        return KeyframeIndex(path, keyframes, frame)
+
+    def save(self, fingerprint, mtime):
+        sidecar = self.sidecar_path(self.path)
+        try:
+            with open(sidecar, "w") as f:
+                json.dump({"version": INDEX_VERSION, "hash": fingerprint, "mtime": mtime,
+                           "frames": self.total_frames, "keyframes": self.keyframes}, f)
+        except OSError as e:
+            Log.warning(f"Couldn't write keyframe index {sidecar}: {e}")
@@ -0,0 +1,248 @@
+import logging
+import time
+from threading import Event, Thread
+
+import numpy as np
+
+from musejack.metrics import METRICS
+from musejack.players import Audio, Video
+
+Log = logging.getLogger(__name__)
+
+# extra media around the region, so a wrap that lands a little early or late still stays in memory
+MARGIN_SECONDS = 0.25
+
+
+class LoopFrames:
+    """
+    Frames start up to start + len(frames) of one video, decoded ahead for a loop. They get decoded in order, the
+    first ready ones can be used while the rest is still decoding.
+    """
+
+    def __init__(self, start, frames):
+        self.start = start
+        self.frames = frames
+        self.ready = 0
+
+    def nbytes(self) -> int:
+        return self.frames.nbytes
+
+    def get_into(self, index, out) -> bool:
+        i = index - self.start
+        if not 0 <= i < self.ready:
+            return False
+        np.copyto(out, self.frames[i])
+        return True
+
+
+class LoopSamples:
+    """
+    Samples (at the JACK rate) start up to start + len(samples) of one audio file, read ahead for a loop.
+    """
+
+    def __init__(self, start, samples):
+        self.start = start
+        self.samples = samples
+        self.ready = 0
+
+    def nbytes(self) -> int:
+        return self.samples.nbytes
+
+    def contains(self, jack_frame) -> bool:
+        return self.start <= jack_frame < self.start + self.ready
+
+    def read_into(self, jack_frame, out) -> int:
+        block = self.samples[jack_frame - self.start:self.ready][:len(out)]
+        out[:len(block)] = block
+        return len(block)
+
+
+class LoopDetector:
+    """
+    Spots a loop in the relocates of the transport: two jumps back to the same spot from the same spot, within
+    tolerance frames (the relocate is only seen at the start of the next period).
+    """
+
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.last = None
+
+    def relocated(self, from_frame, to_frame):
+        """
+        Returns the (start, end) of the loop once a relocate repeats the last one, otherwise None.
+        """
+        last, self.last = self.last, (from_frame, to_frame)
+        if last is None or to_frame >= from_frame:
+            return None
+        if abs(last[0] - from_frame) <= self.tolerance and abs(last[1] - to_frame) <= self.tolerance:
+            return to_frame, max(from_frame, last[0])
+        return None
+
+
+class LoopPreloader:
+    """
+    Rehearsal mode: holds the media of a loop region of the timeline in memory, so every wrap around the loop gets
+    served from RAM instead of seeking and decoding the files again.
+
+    The region is either given (set_region) or detected from the relocates of the Dispatcher (relocated). A worker
+    thread decodes the video frames and reads the audio the region covers into per player loop buffers, which the
+    players pick up on their own: Video decode threads copy frames from them and Audio players fill their ring from
+    them. Everything together stays under budget bytes; when a region doesn't fit, the part from its start on that does
+    is held, since that's where every wrap lands.
+    """
+
+    def __init__(self, timeline, budget, detect=True):
+        self.timeline = timeline
+        self.budget = budget
+        self.detector = LoopDetector(tolerance=4096) if detect else None
+
+        self.region = None
+        self.requested = None
+        self.buffers = {}  # player -> LoopFrames or LoopSamples of the current region
+        self.used = 0
+        self.truncated = False  # the budget didn't hold all of the region
+
+        self.wakeup = Event()
+        self.stopped = False
+        self.thread = Thread(target=self._load_loop, daemon=True, name="loop")
+        METRICS.gauge("loop.memory_mb", lambda: self.used / 1024 / 1024)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        self.thread.join()
+        METRICS.remove_gauge("loop.memory_mb")
+
+    def relocated(self, from_frame, to_frame):
+        if self.detector is None:
+            return
+        region = self.detector.relocated(from_frame, to_frame)
+        if region is not None and region != self.region:
+            Log.info(f"Detected a loop from {region[0] / self.timeline.samplerate:.2f} s "
+                     f"to {region[1] / self.timeline.samplerate:.2f} s")
+            self.set_region(*region)
+
+    def set_region(self, start, end):
+        """
+        Holds the media from transport frame start to end in memory, replacing the last region.
+        """
+        self.requested = (start, end)
+        self.wakeup.set()
+
+    def clear(self):
+        self.requested = None
+        self.region = None
+        self.wakeup.set()
+
+    def _load_loop(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            if self.stopped:
+                self._release()
+                return
+            region = self.requested
+            self._release()
+            if region is not None:
+                self.region = region
+                self._load(*region)
+
+    def _release(self):
+        for player in self.buffers:
+            player.loop_buffer = None
+        self.buffers = {}
+        self.used = 0
+
+    def _superseded(self) -> bool:
+        return self.stopped or self.wakeup.is_set()
+
+    def _load(self, start, end):
+        began = time.perf_counter()
+        timeline = self.timeline
+        margin = round(MARGIN_SECONDS * timeline.samplerate)
+
+        # media range every player plays in the region, audio first as it's small and its gaps are audible
+        ranges = {}
+        position = start
+        while position < end:
+            index = timeline.resolve(position)
+            until = end if index + 1 >= len(timeline.starts) else min(end, int(timeline.starts[index + 1]))
+            for i in timeline.group(index):
+                player = timeline.players.get(timeline.paths[i])
+                if player is None:
+                    continue
+                first = timeline.media_frame(i, position) - margin
+                last = timeline.media_frame(i, until) + margin
+                known = ranges.get(player)
+                ranges[player] = (first, last) if known is None else (min(known[0], first), max(known[1], last))
+            position = until
+        players = sorted(ranges, key=lambda player: not isinstance(player, Audio))
+        self.truncated = False
+
+        # the players read ahead up to a ring past the end of the loop before it wraps, that comes from memory too
+        for player in players:
+            first, last = ranges[player]
+            if isinstance(player, Audio):
+                self._load_audio(player, max(first, 0), min(last + player.ring.capacity, player.frames))
+            elif isinstance(player, Video):
+                per_frame = player.jack_frames_per_frame
+                self._load_video(player, max(int(first // per_frame), 0),
+                                 min(int(last // per_frame) + 1 + player.ring.capacity, player.total_frames))
+            if self._superseded():
+                return
+
+        seconds = (end - start) / timeline.samplerate
+        Log.info(f"Holding a {seconds:.1f} s loop of {len(self.buffers)} players in "
+                 f"{self.used / 1024 / 1024:.1f} of {self.budget / 1024 / 1024:.0f} MB"
+                 f"{' (only partly, raise the loop memory for all of it)' if self.truncated else ''}, "
+                 f"loaded in {time.perf_counter() - began:.1f} s")
+
+    def _fit(self, count, item_bytes) -> int:
+        fits = max(0, min(count, (self.budget - self.used) // item_bytes))
+        if fits < count:
+            self.truncated = True
+        return fits
+
+    def _load_audio(self, player, first, last):
+        from musejack.pcmcache import PcmReader
+        count = self._fit(last - first, player.ring.channels * 4)
+        if not count:
+            return
+        buffer = LoopSamples(first, np.empty((count, player.ring.channels), dtype=np.float32))
+        self.buffers[player] = buffer
+        self.used += buffer.nbytes()
+
+        reader = PcmReader(player.audio_file_name, self.timeline.samplerate)
+        try:
+            buffer.samples[:] = reader.read(first, count)
+        finally:
+            reader.close()
+        buffer.ready = count
+        player.loop_buffer = buffer
+
+    def _load_video(self, player, first, last):
+        from musejack.decoder import Decoder
+        width, height = player.size
+        count = self._fit(last - first, width * height * 3)
+        if not count:
+            return
+        buffer = LoopFrames(first, np.empty((count, height, width, 3), dtype=np.uint8))
+        self.buffers[player] = buffer
+        self.used += buffer.nbytes()
+
+        # a decoder of our own, the player's keeps serving its decode thread meanwhile
+        decoder = Decoder(player.video_file_name, buffer.frames, player.frame_rate)
+        player.loop_buffer = buffer
+        try:
+            for i in range(count):
+                if self._superseded():
+                    return
+                decoded, _, _ = decoder.decode(i, first + i)
+                if not decoded:
+                    return
+                buffer.ready = i + 1
+        finally:
+            decoder.close()
@@ -1,3 +1,5 @@
+import argparse
+import multiprocessing
 import os
 import shutil
 import sys
@@ -6,7 +8,7 @@ import logging
 from pathlib import Path
 
 from musejack import util
-from musejack.util import resource_path
+from musejack.util import Stopwatch, resource_path
 
 if "--debug" in sys.argv:
     logging.basicConfig(level=logging.DEBUG)
@@ -16,6 +18,79 @@ Log = logging.getLogger(__name__)
 
 
 if __name__ == "__main__":
+    # decoder processes re-run the frozen executable, this hands them over to their worker
+    multiprocessing.freeze_support()
+    startup = Stopwatch()
+
+    parser = argparse.ArgumentParser(description="Syncs video files to Musescore scores over JACK")
+    parser.add_argument("mjck", nargs="?", help=".mjck file with the cue points, written by the MuseJack plugin")
+    parser.add_argument("--debug", action="store_true", help="log debug messages")
+    parser.add_argument("--no-watch", action="store_true",
+                        help="don't pick up changes to the .mjck file while running")
+    parser.add_argument("--follow", action="store_true",
+                        help="follow the JACK transport from the process callback instead of being timebase master, "
+                             "so another client can have that role")
+    parser.add_argument("--budget", type=float, default=0.25,
+                        help="share of the JACK period the timebase callback may take before it gets reported "
+                             "(default: %(default)s)")
+    parser.add_argument("--proxy", action="store_true",
+                        help="build low resolution proxies of the videos in the background and play from those")
+    parser.add_argument("--proxy-size", default="480x360",
+                        help="width x height of the proxies (default: %(default)s)")
+    parser.add_argument("--proxy-workers", type=int, default=2,
+                        help="proxies built at the same time (default: %(default)s)")
+    parser.add_argument("--preview-size", default="480x360",
+                        help="width x height of the preview window (default: %(default)s)")
+    parser.add_argument("--monitor", metavar="WxH",
+                        help="also show the video fullscreen at this size, e.g. on a second screen; videos get decoded "
+                             "at this size then and scaled down for the preview")
+    parser.add_argument("--refresh", type=float, default=60.0,
+                        help="refresh rate of the display in Hz, frames get shown at this pace (default: %(default)s)")
+    parser.add_argument("--burn-in", action="store_true", help="burn the timecode into the video output")
+    parser.add_argument("--frame-cache", type=int, default=256, metavar="MB",
+                        help="memory for decoded frames around recent seek targets, 0 disables it "
+                             "(default: %(default)s)")
+    parser.add_argument("--gain", action="append", default=[], metavar="FILE=DB",
+                        help="gain in dB of the audio cues playing FILE (its name, without folders), can be repeated")
+    parser.add_argument("--mute", action="append", default=[], metavar="FILE",
+                        help="mute the audio cues playing FILE (its name, without folders), can be repeated")
+    parser.add_argument("--pcm-cache", action="store_true",
+                        help="decode (and resample) every audio file once into a memory mapped cache, so seeking in "
+                             "it costs nothing")
+    parser.add_argument("--loop", nargs="?", const="auto", metavar="START:END",
+                        help="rehearsal mode: hold the media of a loop region in memory so every wrap plays from RAM. "
+                             "Give the region in seconds, or leave it out to detect MuseScore's loops")
+    parser.add_argument("--loop-memory", type=int, default=512, metavar="MB",
+                        help="memory for the loop region (default: %(default)s)")
+    parser.add_argument("--peaks", action="store_true",
+                        help="build waveform peak caches of all media in the background")
+    parser.add_argument("--decode-processes", action="store_true",
+                        help="decode every video in its own process instead of a thread of the player")
+    parser.add_argument("--export", metavar="FILE",
+                        help="render the synced video and MuseScore's audio into FILE in JACK freewheel mode, then quit")
+    parser.add_argument("--export-size", default="1280x720",
+                        help="width x height of the exported video (default: %(default)s)")
+    parser.add_argument("--export-range", metavar="START:END",
+                        help="seconds of the transport to export (default: from the first cue to the end of the last)")
+    parser.add_argument("--export-from", default="mscore",
+                        help="JACK client whose outputs get recorded into the export (default: %(default)s)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="collect timing metrics, log them periodically and dump them as JSON on exit")
+    parser.add_argument("--metrics-interval", type=float, default=5.0,
+                        help="seconds between metrics log lines (default: %(default)s)")
+    parser.add_argument("--metrics-out", default="musejack_metrics.json",
+                        help="file the metrics get dumped to on exit (default: %(default)s)")
+    args = parser.parse_args()
+    gains = {}
+    for setting in args.gain:
+        name, _, db = setting.rpartition("=")
+        try:
+            gains[name] = float(db)
+        except ValueError:
+            name = ""
+        if not name:
+            parser.error(f"--gain takes FILE=DB, not {setting}")
+
     Log.info("Starting MuseJack")
 
     try:
@@ -24,6 +99,18 @@ if __name__ == "__main__":
         Log.error("Couldn't load JACK audio connection kit. Make sure it is installed!")
         quit()
     Log.info("JACK audio connection kit found succesfully")
+    startup.lap("jack")
+
+    # opencv and soundfile are only imported once a player needs them
+    from musejack.buffers import FrameCache
+    from musejack.dispatch import Dispatcher, Follower, StopDetector
+    from musejack.metrics import METRICS
+    from musejack.timeline import AUDIO_EXTENSIONS, Timeline
+    from musejack.watcher import MjckWatcher
+    startup.lap("imports")
+
+    if args.metrics:
+        METRICS.enable(args.metrics_interval)
 
     #todo this is OC specific
     prefs = util.load_musescore_ini(Path("C:\\Users\\Anton\\AppData\\Roaming\\MuseScore\\musescore3.ini"))
@@ -49,6 +136,8 @@ if __name__ == "__main__":
     else:
         Log.info("Musejack plugin found succesfully")
 
+    startup.lap("musescore")
+
     #initiating client
     @jack.set_error_function
     def error(msg):
@@ -70,6 +159,8 @@ if __name__ == "__main__":
         print(f"unique client name generated: {client.name}")
 
 
+    startup.lap("client")
+
     @client.set_shutdown_callback
     def shutdown(status, reason):
         Log.error('JACK shutdown!')
@@ -78,38 +169,119 @@ if __name__ == "__main__":
         quit()
 
 
+    dispatcher = None  # exports don't follow the transport with one
+
+    # both get called once on activation too, with what we already use
     @client.set_blocksize_callback
     def blocksize(blocksize):
-        pass # this should
+        if dispatcher is not None and blocksize != dispatcher.blocksize:
+            Log.info(f"JACK period size changed to {blocksize}")
+            timeline.reconfigure(client.samplerate, blocksize)
+            dispatcher.set_period(client.samplerate, blocksize)
 
 
     @client.set_samplerate_callback
     def samplerate(samplerate):
-        pass
+        if dispatcher is not None and samplerate != timeline.samplerate:
+            Log.info(f"JACK samplerate changed to {samplerate}")
+            timeline.reconfigure(samplerate, client.blocksize)
+            dispatcher.set_period(samplerate, client.blocksize)
 
 
     @client.set_xrun_callback
     def xrun(delay):
-        Log.debug('xrun; delay', delay, 'microseconds')
+        Log.debug(f"xrun; delay {delay} microseconds")
+        METRICS.xrun(delay)
 
-    players = []
+    if args.mjck:
+        timeline = Timeline.load(args.mjck, client.samplerate)
+    else:
+        Log.warning("No .mjck file given, nothing will be played")
+        timeline = Timeline([], client.samplerate)
+    startup.lap("cues")
+
+    if args.export:
+        from musejack.export import Exporter
+        width, height = (int(x) for x in args.export_size.lower().split("x"))
+        start, end = None, None
+        if args.export_range:
+            start, end = (float(x) if x else None for x in args.export_range.split(":"))
+        exporter = Exporter(client, timeline, args.export, (width, height), start=start, end=end,
+                            burn_in=args.burn_in, gains=gains, muted=args.mute)
+        with client:
+            exporter.connect(args.export_from)
+            exporter.run()
+        quit()
 
-    current_state = -1
-    @client.set_timebase_callback
-    def callback(state: int, blocksize: int, position, new_pos: bool) -> None:
-        global current_state
-        if state != current_state:
-            # if the new state is the rolling state, start the video
-            Log.debug(f"new state {state}")
-            if state == jack.ROLLING:
-                Log.debug(f"seeking to audio frame {position.frame}")
-                for player in players:
-                    player._seek(position.frame)
+    proxies = None
+    if args.proxy:
+        from musejack.proxy import ProxyBuilder
+        width, height = (int(x) for x in args.proxy_size.lower().split("x"))
+        proxies = ProxyBuilder(timeline.directory, (width, height), args.proxy_workers)
+    frame_cache = None
+    if args.frame_cache > 0:
+        frame_cache = FrameCache(args.frame_cache * 1024 * 1024)
+        METRICS.gauge("frame_cache.hit_rate", lambda: frame_cache.hit_rate() * 100)
+    size = tuple(int(x) for x in args.preview_size.lower().split("x"))
+    sinks = None
+    if any(Path(path).suffix.lower() not in AUDIO_EXTENSIONS for path in timeline.paths):
+        from musejack.display import WindowSink  # pulls in opencv, only needed with videos
+        sinks = [WindowSink("output", size)]
+        if args.monitor:
+            size = tuple(int(x) for x in args.monitor.lower().split("x"))
+            sinks.append(WindowSink("monitor", size, fullscreen=True))
+    players = timeline.open_players(client, proxies, burn_in=args.burn_in, frame_cache=frame_cache,
+                                     pcm_cache=args.pcm_cache, process=args.decode_processes, sinks=sinks, size=size,
+                                     refresh=args.refresh)
+    startup.lap("media")
+
+    names = {Path(path).name for path in timeline.paths}
+    for name in {*gains, *args.mute}:
+        if name not in names:
+            Log.warning(f"No cue plays {name}, its gain and mute apply once a reload adds it")
+        timeline.mixer.configure(name, gain_db=gains.get(name), muted=True if name in args.mute else None)
+
+    peak_pool = None
+    if args.peaks:
+        from concurrent.futures import ThreadPoolExecutor
+        from functools import partial
+        from musejack.peaks import open_peaks
+
+        def peaks_ready(player, future):
+            if future.exception():
+                Log.warning(f"Couldn't build the peaks of {player.name}: {future.exception()}")
+            else:
+                player.peaks = future.result()
 
-            current_state = state
+        peak_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="peaks")
+        for path, player in timeline.players.items():
+            peak_pool.submit(open_peaks, path).add_done_callback(partial(peaks_ready, player))
 
-        for player in players:
-            player._step()
+    dispatcher = Dispatcher(timeline, client.samplerate, client.blocksize, budget=args.budget)
+    if args.follow:
+        follower = Follower(client, dispatcher, chained=timeline.mixer.process)
+        client.set_process_callback(follower.process)
+        timeline.set_clock(follower.clock)
+    else:
+        client.set_timebase_callback(dispatcher)
+        client.set_process_callback(StopDetector(client, dispatcher, chained=timeline.mixer.process).process)
+    dispatcher.start()
+
+    loop = None
+    if args.loop:
+        from musejack.loop import LoopPreloader
+        loop = LoopPreloader(timeline, args.loop_memory * 1024 * 1024, detect=args.loop == "auto")
+        loop.start()
+        if args.loop == "auto":
+            dispatcher.on_relocate = loop.relocated
+        else:
+            start, end = (float(x) for x in args.loop.split(":"))
+            loop.set_region(round(start * client.samplerate), round(end * client.samplerate))
+
+    watcher = None
+    if args.mjck and not args.no_watch:
+        watcher = MjckWatcher(args.mjck, timeline)
+        watcher.start()
 
     Log.info("activating JACK")
     try:
@@ -124,9 +296,29 @@ if __name__ == "__main__":
             else:
                 for source, target in zip(client.outports, target_ports):
                     source.connect(target)
+            startup.lap("activate")
+            Log.info(f"Ready in {startup.total():.2f} s: {startup.summary()}")
             input()
+    except KeyboardInterrupt:
+        pass  # Ctrl-C quits like enter does
     except Exception as e:
         print(e)
+    finally:
+        # also on Ctrl-C, so the threads stop and the metrics of the session get written
+        if watcher is not None:
+            watcher.stop()
+        dispatcher.stop()
+        if loop is not None:
+            loop.stop()
+        if timeline.presenter is not None:
+            timeline.presenter.stop()
+        if proxies is not None:
+            proxies.shutdown()
+        if peak_pool is not None:
+            peak_pool.shutdown(wait=False, cancel_futures=True)
+
+        if args.metrics:
+            METRICS.dump(args.metrics_out)
 
 
 
@@ -0,0 +1,166 @@
+import gc
+import json
+import logging
+import time
+from threading import Event, Thread
+
+Log = logging.getLogger(__name__)
+
+BUCKETS = 48
+
+
+class Histogram:
+    """
+    Histogram with power of two buckets. Recording is an int conversion and a list increment, so it is cheap enough
+    for the hot paths; values are scaled (seconds to microseconds by default) before bucketing.
+    """
+
+    def __init__(self, registry, name, scale=1e6, unit="us"):
+        self.registry = registry
+        self.name = name
+        self.scale = scale
+        self.unit = unit
+
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        if not self.registry.enabled:
+            return
+        scaled = int(value * self.scale)
+        self.buckets[min(scaled.bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += scaled
+        if scaled > self.max:
+            self.max = scaled
+
+    def percentile(self, p) -> int:
+        """
+        Upper edge of the bucket holding the p-th percentile.
+        """
+        if not self.count:
+            return 0
+        target = self.count * p / 100
+        seen = 0
+        for bucket, amount in enumerate(self.buckets):
+            seen += amount
+            if seen >= target:
+                return min((1 << bucket) - 1, self.max) if bucket else 0
+        return self.max
+
+    def reset(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def summary(self) -> str:
+        return f"{self.name} p50={self.percentile(50)} p99={self.percentile(99)} max={self.max}{self.unit}"
+
+    def to_dict(self) -> dict:
+        return {"unit": self.unit, "count": self.count, "mean": self.total / self.count if self.count else 0,
+                "p50": self.percentile(50), "p90": self.percentile(90), "p99": self.percentile(99), "max": self.max,
+                "buckets": {str(1 << b if b else 0): n for b, n in enumerate(self.buckets) if n}}
+
+
+class Metrics:
+    """
+    Registry of the timing histograms, the sampled gauges (queue fill levels) and the xruns of a MuseJack run.
+    Everything is a no-op until enable() gets called.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.gauges = {}
+
+        # what every thread is doing right now, snapshotted on every xrun
+        self.activity = {}
+        self.xruns = []
+        self.xruns_during = {}
+
+        self.gc_seen = 0
+
+        self.started = time.time()
+        self.stopped = Event()
+        self.reporter = None
+
+    def histogram(self, name, scale=1e6, unit="us") -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(self, name, scale, unit)
+        return self.histograms[name]
+
+    def gauge(self, name, sample):
+        """
+        Registers a callable that gets sampled periodically into a histogram, e.g. the fill level of a ring.
+        """
+        self.gauges[name] = (sample, self.histogram(name, scale=1, unit=""))
+
+    def remove_gauge(self, name):
+        self.gauges.pop(name, None)
+
+    def _gc_collections(self) -> int:
+        collections = sum(generation["collections"] for generation in gc.get_stats())
+        new, self.gc_seen = collections - self.gc_seen, collections
+        return new
+
+    def mark(self, who, what):
+        self.activity[who] = what
+
+    def xrun(self, delay):
+        if not self.enabled:
+            return
+        running = dict(self.activity)
+        self.xruns.append({"time": time.time() - self.started, "delay_us": delay, "running": running})
+        for who, what in running.items():
+            key = f"{who}:{what}"
+            self.xruns_during[key] = self.xruns_during.get(key, 0) + 1
+
+    def reset(self):
+        """
+        Starts every histogram and the xrun log over, e.g. between benchmark runs.
+        """
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.xruns = []
+        self.xruns_during = {}
+        self.started = time.time()
+
+    def enable(self, interval=5.0):
+        self.enabled = True
+        # garbage collections per sampling interval show how much the hot paths allocate
+        self._gc_collections()
+        self.gauge("gc.collections", self._gc_collections)
+        self.reporter = Thread(target=self._report_loop, args=(interval,), daemon=True)
+        self.reporter.start()
+
+    def _report_loop(self, interval):
+        next_report = time.perf_counter() + interval
+        while not self.stopped.wait(0.1):
+            for sample, histogram in list(self.gauges.values()):
+                histogram.record(sample())
+            if time.perf_counter() >= next_report:
+                next_report += interval
+                Log.info(self.summary())
+
+    def summary(self) -> str:
+        parts = [h.summary() for h in self.histograms.values() if h.count]
+        parts.append(f"xruns={len(self.xruns)}")
+        return "metrics: " + ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        return {"duration": time.time() - self.started,
+                "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+                "xruns": self.xruns,
+                "xruns_during": self.xruns_during}
+
+    def dump(self, path):
+        self.stopped.set()
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        Log.info(f"Wrote metrics to {path}")
+
+
+METRICS = Metrics()
@@ -0,0 +1,142 @@
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+
+from musejack.metrics import METRICS
+from musejack.players import State, realtime
+
+Log = logging.getLogger(__name__)
+
+MIX_TIME = METRICS.histogram("mixer.process")
+
+
+def db_to_gain(db) -> float:
+    return 10 ** (db / 20)
+
+
+class MixerState:
+    """
+    Everything the process callback needs, replaced as a whole whenever a stem, gain or mute changes, so the callback
+    never sees a half updated mixer.
+    """
+
+    def __init__(self, stems, channels, blocksize, gains, muted):
+        self.stems = stems
+        rows = sum(stem.ring.channels for stem in stems)
+
+        # every channel of every stem gets one row, the callback reads the rings straight into these
+        self.buffer = np.zeros((max(rows, 1), blocksize), dtype=np.float32)
+        self.mix = np.zeros((channels, blocksize), dtype=np.float32)
+        self.outputs = []
+
+        # bus channel x stem row matrix holding the gains and the routing, so mixing is one matrix product
+        self.matrix = np.zeros((channels, max(rows, 1)), dtype=np.float32)
+        row = 0
+        for stem in stems:
+            stem_channels = stem.ring.channels
+            self.outputs.append([self.buffer[row + channel] for channel in range(stem_channels)])
+            gain = 0.0 if muted.get(stem, False) else gains.get(stem, 1.0)
+            for channel in range(stem_channels):
+                if stem_channels == 1:
+                    self.matrix[:, row] = gain  # mono stems go to every bus channel
+                elif channel < channels:
+                    self.matrix[channel, row + channel] = gain
+            row += stem_channels
+
+
+class Mixer:
+    """
+    Output bus of every Audio player (stem). Owns the output ports and the JACK process callback, and sums the stems
+    into the ports with a per stem gain and mute.
+
+    Per block every stem ring gets copied into its rows of a preallocated buffer, and a single matrix product with the
+    gain matrix mixes all of them into the bus.
+    """
+
+    def __init__(self, client, channels=2):
+        self.client = client
+        self.channels = channels
+        self.blocksize = client.blocksize
+
+        self.ports = [client.outports.register(f"out_{channel + 1}") for channel in range(channels)]
+        self.gains = {}
+        self.muted = {}
+        # gain and mute by file name, for stems that get added later too
+        self.named_gains = {}
+        self.named_muted = {}
+        self.state = MixerState([], channels, self.blocksize, self.gains, self.muted)
+
+        client.set_process_callback(self.process)
+
+    def set_blocksize(self, blocksize):
+        """
+        Reallocates the buffers for a new JACK period size, JACK doesn't run the process callback meanwhile.
+        """
+        self.blocksize = blocksize
+        self._rebuild(self.state.stems)
+
+    def _rebuild(self, stems):
+        self.state = MixerState(stems, self.channels, self.blocksize, self.gains, self.muted)
+
+    def add(self, stem):
+        if stem.ring.channels > self.channels:
+            Log.warning(f"{stem.name} has {stem.ring.channels} channels, only the first {self.channels} are mixed")
+        self._apply_named(stem)
+        self._rebuild(self.state.stems + [stem])
+
+    def remove(self, stem):
+        self.gains.pop(stem, None)
+        self.muted.pop(stem, None)
+        self._rebuild([s for s in self.state.stems if s is not stem])
+
+    def set_gain(self, stem, gain):
+        """
+        Linear gain of a stem, 1 leaves it as it is.
+        """
+        self.gains[stem] = gain
+        self._rebuild(self.state.stems)
+
+    def set_gain_db(self, stem, db):
+        self.set_gain(stem, db_to_gain(db))
+
+    def set_mute(self, stem, muted=True):
+        self.muted[stem] = muted
+        self._rebuild(self.state.stems)
+
+    def configure(self, name, gain_db=None, muted=None):
+        """
+        Gain (in dB) and mute of the stems playing the file called name, including the ones added later, e.g. by a
+        reload of the cues. None leaves a setting as it is.
+        """
+        if gain_db is not None:
+            self.named_gains[name] = db_to_gain(gain_db)
+        if muted is not None:
+            self.named_muted[name] = muted
+        for stem in self.state.stems:
+            self._apply_named(stem)
+        self._rebuild(self.state.stems)
+
+    def _apply_named(self, stem):
+        name = Path(stem.audio_file_name).name
+        if name in self.named_gains:
+            self.gains[stem] = self.named_gains[name]
+        if name in self.named_muted:
+            self.muted[stem] = self.named_muted[name]
+
+    @realtime
+    def process(self, frames):
+        start = time.perf_counter()
+        state = self.state
+        for stem, outputs in zip(state.stems, state.outputs):
+            if stem.status is State.PLAYING:
+                stem.ring.read_into(outputs, frames, stem.transport_frame)
+            else:
+                for out in outputs:
+                    out.fill(0)
+
+        np.dot(state.matrix, state.buffer, out=state.mix)
+        for port, channel in zip(self.ports, state.mix):
+            port.get_array()[:] = channel[:frames]
+        MIX_TIME.record(time.perf_counter() - start)
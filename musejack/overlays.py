@@ -0,0 +1,113 @@
+import cv2
+import numpy as np
+
+
+class Sprite:
+    """
+    Text rendered once into a small image plus a mask, drawing it is a masked copy into the region it covers.
+    """
+
+    def __init__(self, text, font_face=cv2.FONT_HERSHEY_SIMPLEX, scale=0.4, color=(0, 0, 0), thickness=1):
+        (width, height), baseline = cv2.getTextSize(text, font_face, scale, thickness)
+        self.width = width
+        self.height = height + baseline
+
+        # render white on black so the rendered pixels double as the mask
+        canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        cv2.putText(canvas, text, (0, height), font_face, scale, (255, 255, 255), thickness, cv2.LINE_AA)
+        self.mask = canvas[:, :, :1] > 127
+        self.image = np.empty_like(canvas)
+        self.image[:] = color
+
+    def draw(self, image, x, y):
+        """
+        Draws the sprite with its top left corner at (x, y), clipped to the image.
+        """
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + self.width, image.shape[1]), min(y + self.height, image.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return
+        np.copyto(image[y0:y1, x0:x1], self.image[y0 - y:y1 - y, x0 - x:x1 - x],
+                  where=self.mask[y0 - y:y1 - y, x0 - x:x1 - x])
+
+
+class TextField:
+    """
+    Text shown on top of the video for a number of frames.
+    """
+
+    def __init__(self, text="Hello World", middle=(200, 200), duration=60):
+        self.duration = duration
+        self.middle = middle
+        self.text = text
+
+        self.font_face = cv2.FONT_HERSHEY_SIMPLEX
+        self.scale = 0.4
+        self.color = (0, 0, 0)
+        self.thickness = 1
+
+        self.drawn_frames = 0
+
+        # the text never changes, so it only gets rasterized once
+        self.sprite = Sprite(text, self.font_face, self.scale, self.color, self.thickness)
+
+        # from the middle coordinates, get the start coordinates
+        self.start_x = round(middle[0] - self.sprite.width / 2)
+        self.start_y = round(middle[1] - self.sprite.height / 2)
+
+    @staticmethod
+    def normal(text, frame_width, offset_width=0, offset_height=0):
+        # we want the start height to be
+        return TextField(text, middle=((frame_width + offset_width) / 2, 200 + offset_height))
+
+    @staticmethod
+    def center(text, frame_width, frame_height, offset_width=0, offset_height=0):
+        return TextField(text, middle=((frame_width + offset_width) / 2, (frame_height + offset_height) / 2))
+
+    def draw(self, image):
+        self.drawn_frames += 1
+        self.sprite.draw(image, self.start_x, self.start_y)
+
+    def done(self) -> bool:
+        if self.drawn_frames > self.duration:
+            return True
+        return False
+
+
+class TimecodeOverlay:
+    """
+    HH:MM:SS:FF burn-in of the presented frame. The digits come from a glyph atlas that is rendered once, so drawing
+    a timecode is eleven masked copies and no text rendering or string formatting.
+    """
+
+    def __init__(self, frame_rate, position=(8, 8), scale=0.5, color=(255, 255, 255), background=(0, 0, 0)):
+        self.frame_rate = max(1, round(frame_rate))
+        self.position = position
+
+        self.glyphs = {c: Sprite(c, scale=scale, color=color) for c in "0123456789:"}
+        self.cell = max(glyph.width for glyph in self.glyphs.values())
+        self.digits = [self.glyphs[str(d)] for d in range(10)]
+        self.colon = self.glyphs[":"]
+
+        self.width = self.cell * 11
+        self.height = max(glyph.height for glyph in self.glyphs.values())
+        self.background = np.empty((self.height + 4, self.width + 4, 3), dtype=np.uint8)
+        self.background[:] = background
+
+    def draw(self, image, frame):
+        x, y = self.position
+        region = image[y:y + self.background.shape[0], x:x + self.background.shape[1]]
+        np.copyto(region, self.background[:region.shape[0], :region.shape[1]])
+
+        seconds, frames = divmod(frame, self.frame_rate)
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+
+        x, y = x + 2, y + 2
+        for i, value in enumerate((hours % 100, minutes, seconds, frames)):
+            if i:
+                self.colon.draw(image, x, y)
+                x += self.cell
+            self.digits[value // 10 % 10].draw(image, x, y)
+            self.digits[value % 10].draw(image, x + self.cell, y)
+            x += 2 * self.cell
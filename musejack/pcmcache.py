@@ -0,0 +1,113 @@
+import logging
+import time
+
+import numpy as np
+import soundfile
+
+from musejack.resample import Resampler
+from musejack.util import atomic_write, cache_dir, cache_key
+
+Log = logging.getLogger(__name__)
+
+# frames decoded per soundfile read while filling the cache
+DECODE_BLOCK = 1 << 16
+
+
+def cache_path(path, samplerate=None, directory=None):
+    """
+    Location of the decoded cache of an audio file, keyed by its fingerprint and modification time, and by the
+    samplerate when the file gets resampled.
+    """
+    key = cache_key(path, samplerate) if samplerate else cache_key(path)
+    return (directory or cache_dir()).joinpath(key + ".npy")
+
+
+def open_pcm(path, samplerate=None, directory=None) -> np.ndarray:
+    """
+    Returns the whole audio file as a read-only, memory-mapped float32 array shaped (frames, channels), resampled to
+    samplerate if that differs from the rate of the file.
+    The file gets decoded once into the cache directory, later calls (and later runs) just map that cache.
+    """
+    with soundfile.SoundFile(path) as sf:
+        if sf.samplerate == samplerate:
+            samplerate = None
+
+    cached = cache_path(path, samplerate, directory)
+    if not cached.exists():
+        decode(path, cached, samplerate)
+    return np.load(cached, mmap_mode="r")
+
+
+def decode(path, cached, samplerate=None):
+    start = time.perf_counter()
+    with atomic_write(cached) as tmp:
+        with soundfile.SoundFile(path) as sf:
+            resampler = Resampler(sf.samplerate, samplerate, sf.channels) if samplerate else None
+            frames = resampler.output_length(sf.frames) if resampler else sf.frames
+
+            pcm = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(frames, sf.channels))
+            position = 0
+            while position < frames:
+                if resampler:
+                    block = sf.read(DECODE_BLOCK, dtype="float32", always_2d=True)
+                    block = resampler.process(block, final=len(block) < DECODE_BLOCK)[:frames - position]
+                    pcm[position:position + len(block)] = block
+                    read = len(block)
+                else:
+                    read = len(sf.read(out=pcm[position:position + DECODE_BLOCK], fill_value=None))
+                if not read:
+                    break  # the header promised more frames than there are, the rest stays silent
+                position += read
+            pcm.flush()
+            del pcm
+    Log.info(f"Decoded {path} into {cached} in {time.perf_counter() - start:.1f} s")
+
+
+class PcmReader:
+    """
+    Reads any part of an audio file at the JACK samplerate without going through the cache, sequential reads continue
+    where the last one ended and only other positions seek.
+    """
+
+    def __init__(self, path, samplerate):
+        self.sf = soundfile.SoundFile(path)
+        self.resampler = None
+        if self.sf.samplerate != samplerate:
+            self.resampler = Resampler(self.sf.samplerate, samplerate, self.sf.channels)
+        self.position = 0  # next JACK frame of the media a read continues from
+        self.pending = np.zeros((0, self.sf.channels), dtype=np.float32)
+        self.source_done = False
+
+    def read(self, media_frame, count) -> np.ndarray:
+        if media_frame != self.position:
+            self._seek(media_frame)
+        out = np.zeros((count, self.sf.channels), dtype=np.float32)
+        if self.resampler is None:
+            self.sf.read(out=out, fill_value=None)  # what's past the end stays silent
+        else:
+            read = 0
+            while read < count:
+                if not len(self.pending):
+                    if self.source_done:
+                        break
+                    block = self.sf.read(DECODE_BLOCK, dtype="float32", always_2d=True)
+                    self.source_done = len(block) < DECODE_BLOCK
+                    self.pending = self.resampler.process(block, final=self.source_done)
+                taken = min(count - read, len(self.pending))
+                out[read:read + taken] = self.pending[:taken]
+                self.pending = self.pending[taken:]
+                read += taken
+        self.position = media_frame + count
+        return out
+
+    def _seek(self, media_frame):
+        source_frame = max(media_frame, 0)
+        if self.resampler is not None:
+            source_frame = round(source_frame * self.resampler.down / self.resampler.up)
+            self.resampler.reset()
+            self.pending = self.pending[:0]
+            self.source_done = False
+        self.sf.seek(min(source_frame, self.sf.frames))
+
+    def close(self):
+        self.sf.close()
@@ -0,0 +1,202 @@
+import logging
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+import numpy as np
+
+from musejack.util import atomic_write, cache_dir, cache_key
+
+Log = logging.getLogger(__name__)
+
+# frames summarised by one bucket of the finest level, and buckets merged into one of the next level
+BASE_BUCKET = 256
+LEVEL_FACTOR = 4
+
+# frames read from the source at once while building the pyramid, a multiple of BASE_BUCKET
+BUILD_BLOCK = 1 << 16
+
+# video files have their audio track decoded by ffmpeg, mixed down to mono at this rate
+TRACK_RATE = 48000
+
+PEAK_SCALE = 32767
+
+
+def level_lengths(base_length) -> list:
+    """
+    Number of buckets of every level of a pyramid whose finest level has base_length buckets.
+    """
+    lengths = [base_length]
+    while lengths[-1] > 1:
+        lengths.append(-(-lengths[-1] // LEVEL_FACTOR))
+    return lengths
+
+
+class Peaks:
+    """
+    Min/max pyramid of an audio signal: level 0 has the min and max of every BASE_BUCKET frames, every next level
+    merges LEVEL_FACTOR buckets of the one below. All levels live back to back in one memory-mapped int16 array
+    shaped (buckets, 2).
+
+    A query picks the coarsest level that still has LEVEL_FACTOR buckets per output column, so column edges are off by
+    at most a quarter column, and reduces fewer than LEVEL_FACTOR ** 2 buckets per column. It costs O(width) no matter
+    how long the range is.
+    """
+
+    def __init__(self, data, samplerate):
+        self.data = data
+        self.samplerate = samplerate
+
+        # the length of the finest level follows from the total, as every level is derived from it
+        total, base = len(data), max(1, len(data) * (LEVEL_FACTOR - 1) // LEVEL_FACTOR)
+        while sum(level_lengths(base)) < total:
+            base += 1
+        while sum(level_lengths(base)) > total:
+            base -= 1
+
+        self.levels = []
+        offset = 0
+        for length in level_lengths(base):
+            self.levels.append(data[offset:offset + length])
+            offset += length
+
+    def duration(self) -> float:
+        return len(self.levels[0]) * BASE_BUCKET / self.samplerate
+
+    def range(self, start, end, width):
+        """
+        Min and max (float32, -1 to 1) of width equal columns between start and end seconds. Columns outside the
+        file are silent.
+        """
+        mins = np.zeros(width, dtype=np.float32)
+        maxs = np.zeros(width, dtype=np.float32)
+        if width <= 0 or end <= start:
+            return mins, maxs
+
+        frames_per_column = (end - start) * self.samplerate / width
+        level = 0
+        while level + 1 < len(self.levels) and BASE_BUCKET * LEVEL_FACTOR ** (level + 2) <= frames_per_column:
+            level += 1
+        buckets = self.levels[level]
+        bucket_frames = BASE_BUCKET * LEVEL_FACTOR ** level
+
+        # bucket where every column starts, columns narrower than a bucket repeat it
+        edges = np.linspace(start, end, width + 1) * self.samplerate / bucket_frames
+        starts = np.floor(edges[:-1]).astype(np.int64)
+        inside = (starts >= 0) & (starts < len(buckets))
+        if not inside.any():
+            return mins, maxs
+
+        starts = starts[inside]
+        first, last = starts[0], min(int(np.ceil(edges[1:][inside][-1])), len(buckets))
+        window = buckets[first:max(last, starts[-1] + 1)]
+        mins[inside] = np.minimum.reduceat(window[:, 0], starts - first) / PEAK_SCALE
+        maxs[inside] = np.maximum.reduceat(window[:, 1], starts - first) / PEAK_SCALE
+        return mins, maxs
+
+
+def cache_path(path, directory=None) -> Path:
+    """
+    Location of the peak pyramid of a media file, keyed by its fingerprint and modification time.
+    """
+    key = cache_key(path, "peaks")
+    return (directory or cache_dir()).joinpath(key + ".npy")
+
+
+def open_peaks(path, directory=None) -> Peaks:
+    """
+    Returns the peak pyramid of an audio file, or of the audio track of a video file. It gets built once into the
+    cache directory, later calls (and later runs) just map it.
+    """
+    cached = cache_path(path, directory)
+    samplerate = _samplerate(path)
+    if not cached.exists():
+        build(path, cached)
+    return Peaks(np.load(cached, mmap_mode="r"), samplerate)
+
+
+def _samplerate(path) -> int:
+    import soundfile
+    try:
+        return soundfile.info(str(path)).samplerate
+    except RuntimeError:
+        return TRACK_RATE  # not something soundfile reads, the track gets decoded by ffmpeg
+
+
+def _blocks(path):
+    """
+    Yields float32 blocks shaped (frames, channels) of the audio of path.
+    """
+    import soundfile
+    try:
+        sf = soundfile.SoundFile(str(path))
+    except RuntimeError:
+        sf = None
+
+    if sf is not None:
+        with sf:
+            yield from sf.blocks(BUILD_BLOCK, dtype="float32", always_2d=True)
+        return
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise OSError(f"can't read the audio of {path} without ffmpeg on the PATH")
+    command = [ffmpeg, "-v", "error", "-i", str(path), "-vn", "-ac", "1", "-ar", str(TRACK_RATE), "-f", "f32le", "-"]
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+        while True:
+            data = process.stdout.read(BUILD_BLOCK * 4)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) // 4 * 4], dtype=np.float32).reshape(-1, 1)
+    if process.returncode:
+        raise OSError(f"ffmpeg couldn't decode the audio of {path}")
+
+
+def _reduce(mins, maxs, factor):
+    # pad with the last bucket so a partial group doesn't pick up silence
+    pad = -len(mins) % factor
+    if pad:
+        mins = np.concatenate([mins, np.repeat(mins[-1:], pad)])
+        maxs = np.concatenate([maxs, np.repeat(maxs[-1:], pad)])
+    return mins.reshape(-1, factor).min(axis=1), maxs.reshape(-1, factor).max(axis=1)
+
+
+def _quantize(values):
+    return np.clip(np.round(values * PEAK_SCALE), -PEAK_SCALE, PEAK_SCALE)
+
+
+def build(path, cached):
+    start = time.perf_counter()
+    mins, maxs = [], []
+    rest = np.zeros((0, 1), dtype=np.float32)
+    for block in _blocks(path):
+        if len(rest):
+            block = np.concatenate([rest, block])
+        whole = len(block) // BASE_BUCKET * BASE_BUCKET
+        buckets = block[:whole].reshape(-1, BASE_BUCKET * block.shape[1])
+        mins.append(buckets.min(axis=1))
+        maxs.append(buckets.max(axis=1))
+        rest = block[whole:]
+    if len(rest):
+        mins.append(rest.min(keepdims=True).ravel())
+        maxs.append(rest.max(keepdims=True).ravel())
+
+    level_mins = np.concatenate(mins) if mins else np.zeros(1, dtype=np.float32)
+    level_maxs = np.concatenate(maxs) if maxs else np.zeros(1, dtype=np.float32)
+    levels = [(level_mins, level_maxs)]
+    while len(levels[-1][0]) > 1:
+        levels.append(_reduce(*levels[-1], LEVEL_FACTOR))
+
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_write(cached) as tmp:
+        peaks = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.int16,
+                                          shape=(sum(len(level[0]) for level in levels), 2))
+        offset = 0
+        for level_mins, level_maxs in levels:
+            peaks[offset:offset + len(level_mins), 0] = _quantize(level_mins)
+            peaks[offset:offset + len(level_maxs), 1] = _quantize(level_maxs)
+            offset += len(level_mins)
+        peaks.flush()
+        del peaks
+    Log.info(f"Built the peaks of {path} into {cached} in {time.perf_counter() - start:.1f} s")
@@ -1,11 +1,35 @@
-import asyncio
-import queue
+import logging
+import math
+import time
 from enum import Enum
-from threading import Thread
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import TYPE_CHECKING
 
-import cv2.cv2 as cv2
-import soundfile
-from jack import Client
+import numpy as np
+
+from musejack.buffers import AudioRing, DepthTuner, FrameRing
+from musejack.metrics import METRICS
+from musejack.resample import Resampler
+from musejack.sync import DRIFT, SyncController
+
+if TYPE_CHECKING:
+    from jack import Client  # players only use what the bench's stand-in has too, libjack isn't needed to import them
+
+Log = logging.getLogger(__name__)
+
+# source frames resampled at once when the resampled audio isn't cached
+RESAMPLE_BLOCK = 4096
+
+# how long a video waits for the decoder to show the new position of a stopped transport
+LOCATE_TIMEOUT = 0.5
+
+WAKEUP_TIME = METRICS.histogram("player.wakeup")
+DECODE_TIME = METRICS.histogram("video.decode")
+RESIZE_TIME = METRICS.histogram("video.resize")
+OVERLAY_TIME = METRICS.histogram("video.overlay")
+VIDEO_SEEK_TIME = METRICS.histogram("video.seek")
+AUDIO_SEEK_TIME = METRICS.histogram("audio.seek")
 
 
 class State(Enum):
@@ -23,9 +47,9 @@ class AbstractPlayer(Thread):
     Helper class to abstract some of the player logic
     """
 
-    def __init__(self, client: Client, total_frames, frame_rate=60):
+    def __init__(self, client: "Client", total_frames, frame_rate=60, max_wakeup_latency=0.005, record_drift=True):
 
-        super().__init__(target=self.loop)
+        super().__init__(target=self.loop, daemon=True)
 
         self.client = client
         self.total_frames = total_frames
@@ -38,12 +62,42 @@ class AbstractPlayer(Thread):
         self.on_frame = 0
         self.previous_frame = None
 
+        # JACK frame at which the next frame is due, kept up to date by the player thread so _step only compares
+        self.next_boundary = 0.0
+        self.transport_frame = 0  # last JACK frame passed to _step or _seek
+
+        # decides which frame to present next, dropping frames when we're late and holding when we're early
+        self.sync = SyncController(DRIFT if record_drift else None)
+
         self.text = None
 
+        # min/max waveform pyramid of the media, once it's built
+        self.peaks = None
+
+        # media of the rehearsal loop held in memory, set and cleared by a LoopPreloader
+        self.loop_buffer = None
+
+        # with a TransportClock (following the transport), frames due within a period get presented at their exact
+        # moment instead of at the start of the next period
+        self.clock = None
+
         # flags
         self.status = State.PAUSED
         self.frame_requested = False
         self.seek_requested = -1
+        self.seek_jack_frame = 0  # exact JACK frame of the last seek, for players that can seek finer than a frame
+
+        # the player thread sleeps on this doorbell until _step or _seek ring it, the timeout caps how long a status
+        # change can go unnoticed
+        self.doorbell = Event()
+        self.doorbell_timeout = 0.5
+        self.rung_at = 0.0
+
+        # wakeup latency between ringing the doorbell and the player thread handling it, in seconds
+        self.max_wakeup_latency = max_wakeup_latency
+        self.wakeup_latency = 0.0
+        self.wakeup_latency_max = 0.0
+        self.late_wakeups = 0
 
     def seek(self, oldPos, newPos):
         """
@@ -57,38 +111,106 @@ class AbstractPlayer(Thread):
     def pause_frame(self):
         pass  # this should be implemented by child classes
 
+    def locate_frame(self):
+        self.pause_frame()  # players that can show where a stopped transport got moved to override this
+
     def loop(self):
         while True:
-            if self.frame_requested and self.status is not State.STOPPED:
+            self.doorbell.wait(self.doorbell_timeout)
+            self.doorbell.clear()
+            if self.status is State.STOPPED:
+                return  # retired or shut down, stop rings the doorbell one last time
+
+            if self.frame_requested:
                 self.frame_requested = False
+                self._measure_wakeup()
 
                 # check if a seek was requested
-                if self.seek_requested != -1:
-                    self.seek(self.on_frame, self.seek_requested)
-                    self.on_frame = self.seek_requested  # if seek requested, set on_frame to the requested seek
+                located = self.seek_requested != -1
+                if located:
+                    old_frame, self.on_frame = self.on_frame, self.seek_requested
                     self.seek_requested = -1
+                    self.seek(old_frame, self.on_frame)
+                    self.sync.reset()
                 else:
-                    self.on_frame += 1  # else increment by one
+                    if self.clock is not None and self.status is State.PLAYING:
+                        self._wait_for(self.next_boundary)
+                    expected = int(self._position() // self.jack_frames_per_frame)
+                    next_frame = self.sync.next_frame(self.on_frame, expected)
+                    if next_frame == self.on_frame and self.status is State.PLAYING:
+                        continue  # we're early, keep showing this frame
+                    self.on_frame = next_frame
 
-                # check if we reached the end of the file
+                self.next_boundary = (self.on_frame + 1) * self.jack_frames_per_frame
+
+                # past the end of the file we hold, the player is reused when the transport relocates back into it
                 if self.on_frame > self.total_frames:
-                    self.stop()
+                    self.pause()
+                    continue
 
                 if self.status is State.PLAYING:
                     self.frame()
                 elif self.status is State.PAUSED:
-                    self.pause_frame()
+                    if located:
+                        self.locate_frame()
+                    else:
+                        self.pause_frame()
+
+    def _position(self) -> float:
+        """
+        Where the transport is in the media right now, extrapolated from the start of the cycle with a clock.
+        """
+        if self.clock is None or self.status is not State.PLAYING:
+            return self.transport_frame
+        return self.transport_frame + min(self.clock.elapsed_frames(), self.clock.blocksize)
+
+    def _wait_for(self, jack_frame):
+        # we got rung up to a period early, sleep until the transport actually gets there
+        delay = (jack_frame - self._position()) / self.jack_frame_rate
+        if delay > 0:
+            time.sleep(min(delay, self.clock.blocksize / self.jack_frame_rate))
+
+    def _measure_wakeup(self):
+        self.wakeup_latency = time.perf_counter() - self.rung_at
+        WAKEUP_TIME.record(self.wakeup_latency)
+        if self.wakeup_latency > self.wakeup_latency_max:
+            self.wakeup_latency_max = self.wakeup_latency
+        if self.wakeup_latency > self.max_wakeup_latency:
+            self.late_wakeups += 1
+            Log.debug(f"{self.name} woke up late: {self.wakeup_latency * 1000:.2f} ms")
 
     @realtime
-    def _step(self, jack_frame_amount):
-        if self.on_frame * self.jack_frames_per_frame < jack_frame_amount:
+    def _ring(self):
+        # only ring once per request, setting an already set event would just take the lock again
+        if not self.frame_requested:
+            self.rung_at = time.perf_counter()
             self.frame_requested = True
+            self.doorbell.set()
+
+    @realtime
+    def _step(self, jack_frame_amount):
+        self.transport_frame = jack_frame_amount
+        # with a clock, ring for every boundary before the end of this period
+        lookahead = self.clock.blocksize if self.clock is not None else 0
+        if self.next_boundary < jack_frame_amount + lookahead or self.next_boundary <= jack_frame_amount:
+            self._ring()
 
     @realtime
-    def _seek(self, jack_frame):
+    def _seek(self, jack_frame, play=True):
+        self.transport_frame = jack_frame
+        self.seek_jack_frame = jack_frame
         self.seek_requested = round(jack_frame / self.jack_frames_per_frame)
-        self.frame_requested = True
-        self.play()  # if seeking, automatically start playing
+        if play:
+            self.play()  # if seeking, automatically start playing
+        self._ring()
+
+    def reconfigure(self, samplerate, blocksize):
+        """
+        Called when JACK changes its samplerate or period size.
+        """
+        self.jack_frame_rate = samplerate
+        self.jack_frames_per_frame = samplerate / self.frame_rate
+        self.next_boundary = (self.on_frame + 1) * self.jack_frames_per_frame
 
     def pause(self):
         self.status = State.PAUSED
@@ -98,95 +220,439 @@ class AbstractPlayer(Thread):
 
     def stop(self):
         self.status = State.STOPPED
+        self.doorbell.set()
 
 
 class Audio(AbstractPlayer):
 
-    def __init__(self, client, audio_file_name, buffer_size=20):
-        # todo what if the jack samplerate isn't the same as te audio file sample rate?
-        self.buffer_size = buffer_size
-        self.jack_block_size = client.blocksize
+    @staticmethod
+    def open_source(audio_file_name):
+        """
+        Opens an audio file for an Audio player. Soundfile only gets imported once a session actually has audio.
+        """
+        import soundfile
+        return soundfile.SoundFile(audio_file_name)
 
-        self.queue = asyncio.Queue()
+    def __init__(self, client, audio_file_name, buffer_size=20, pcm_cache=False, source=None, mixer=None,
+                 min_buffer_size=4, max_buffer_size=80):
+        self.buffer_size = buffer_size  # in JACK blocks, tuned between min_buffer_size and max_buffer_size
+        self.max_buffer_size = max_buffer_size
+        self.jack_block_size = client.blocksize
 
-        # read some data from the soundfile
+        # read some data from the soundfile, unless it was opened already
         self.audio_file_name = audio_file_name
+        self.sf = source if source is not None else Audio.open_source(audio_file_name)
+        self.pending = np.zeros((0, self.sf.channels), dtype=np.float32)  # resampled but not yet in the ring
+        self.source_done = False
+        self.source_stale = False  # the file isn't at read_frame, we've been filling from the loop buffer
+
+        # with the cache, the whole file is decoded once and memory mapped, seeking is just moving read_frame
+        self.pcm_cache = pcm_cache
+        self.read_frame = 0  # in JACK frames
+        self._use_samplerate(client.samplerate)
 
-        sf = soundfile.SoundFile(self.audio_file_name)
-        fr = client.blocksize * self.buffer_size / client.samplerate
+        # one of our frames is one JACK block, so _step wakes the feeder up once every period
         super().__init__(client=client,
-                         total_frames=sf.frames,
-                         frame_rate=fr)
+                         total_frames=math.ceil(self.frames / client.blocksize),
+                         frame_rate=client.samplerate / client.blocksize,
+                         record_drift=False)  # its frames are JACK periods, they'd swamp the picture's drift
+
+        self.name = f"audio:{Path(audio_file_name).name}"
+
+        # the player thread keeps this ring filled, the process callback only copies out of it. The ring is allocated
+        # for the deepest buffer, the tuner decides how much of it gets used
+        self.ring = AudioRing(max_buffer_size * client.blocksize, self.sf.channels)
+        self.ring.depth = buffer_size * client.blocksize
+        self.tuner = DepthTuner(buffer_size, min_buffer_size, max_buffer_size)
+        self.seen_underruns = 0
+        METRICS.gauge(f"{self.name}.ring", self.ring.fill)
+
+        # fill runs on the player thread, reconfigure on a JACK thread
+        self.fill_lock = Lock()
+
+        # the mixer owns the ports and the process callback, without one we get a bus of our own
+        if mixer is None:
+            from musejack.mixer import Mixer
+            mixer = Mixer(client, self.sf.channels)
+        self.mixer = mixer
+
+        self.fill()  # pre-fill the ring
+        self.mixer.add(self)
+        self.start()
+
+    def _use_samplerate(self, samplerate):
+        # files that don't match the JACK samplerate get resampled, either once into the cache or block by block
+        self.resampler = None
+        if self.sf.samplerate != samplerate:
+            Log.info(f"Resampling {self.audio_file_name} from {self.sf.samplerate} Hz to {samplerate} Hz")
+            self.resampler = Resampler(self.sf.samplerate, samplerate, self.sf.channels)
+
+        self.pcm = None
+        if self.pcm_cache:
+            from musejack.pcmcache import open_pcm
+            self.pcm = open_pcm(self.audio_file_name, samplerate)
+
+        if self.pcm is not None:
+            self.frames = len(self.pcm)
+        elif self.resampler:
+            self.frames = self.resampler.output_length(self.sf.frames)
+        else:
+            self.frames = self.sf.frames
 
-        self.block_generator = sf.blocks(blocksize=client.blocksize,
-                                         dtype="float32",
-                                         always_2d=True,
-                                         fill_value=0)
+    def fill(self):
+        """
+        Copies from the source straight into the free part of the ring, until the ring is full.
+        """
+        with self.fill_lock:
+            self._fill()
 
-        # register some ports for audio
-        for channel in range(sf.channels):
-            client.outports.register(f'out_{channel + 1}')
+    def _fill(self):
+        while not self.ring.finished:
+            out = self.ring.writable()
+            if not len(out):
+                return
+            loop = self.loop_buffer
+            if loop is not None and loop.contains(self.read_frame):
+                read = loop.read_into(self.read_frame, out)
+                self.source_stale = True
+            elif self.source_stale:
+                # left the loop buffer, continue from the file where it ended
+                self._seek_source()
+                continue
+            elif self.pcm is not None:
+                block = self.pcm[self.read_frame:self.read_frame + len(out)]  # a view into the mapping
+                out[:len(block)] = block
+                read = len(block)
+            elif self.resampler:
+                read = self._read_resampled(out)
+            else:
+                read = len(self.sf.read(out=out, fill_value=None))
+            if not read:
+                self.ring.finish()  # end of the file
+            self.read_frame += read
+            self.ring.advance(read)
+
+    def _read_resampled(self, out) -> int:
+        while not len(self.pending):
+            if self.source_done:
+                return 0
+            block = self.sf.read(RESAMPLE_BLOCK, dtype="float32", always_2d=True)
+            self.source_done = len(block) < RESAMPLE_BLOCK
+            self.pending = self.resampler.process(block, final=self.source_done)
+
+        read = min(len(out), len(self.pending))
+        out[:read] = self.pending[:read]
+        self.pending = self.pending[read:]
+        return read
 
-        self.start()
+    @realtime
+    def _seek(self, jack_frame, play=True):
+        # before the player thread can get to the seek: what's buffered is from before it, the mixer plays silence
+        # until it's gone
+        self.ring.request_seek()
+        super()._seek(jack_frame, play)
 
     def seek(self, oldPos, newPos):
-        pass
+        start = time.perf_counter()
+        seek = self.ring.wanted
+        # seek to the exact sample instead of the start of the block, or where the transport got to by now
+        jack_frame = self.seek_jack_frame
+        if self.status is State.PLAYING:
+            jack_frame = max(jack_frame, self.transport_frame)
+            if self.clock is not None:
+                # a Follower hands over the position of the cycle the mixer already plays, the earliest block this
+                # can still be heard in is the next one (the timebase callback gets that position to begin with)
+                jack_frame += self.clock.blocksize
+        with self.fill_lock:
+            self._reposition(jack_frame, seek)
+            self._fill()
+        self._forget_underruns()
+        AUDIO_SEEK_TIME.record(time.perf_counter() - start)
+
+    def _reposition(self, jack_frame, seek=None):
+        self.read_frame = min(jack_frame, self.frames)
+        loop = self.loop_buffer
+        if loop is not None and loop.contains(self.read_frame):
+            self.source_stale = True  # no need to touch the file, wrapping around a loop stays in memory
+        else:
+            self._seek_source()
+        self.ring.discard(self.read_frame, seek)
+
+    def _seek_source(self):
+        self.source_stale = False
+        if self.pcm is not None:
+            pass
+        elif self.resampler:
+            self.sf.seek(min(round(self.read_frame * self.resampler.down / self.resampler.up), self.sf.frames))
+            self.resampler.reset()
+            self.pending = self.pending[:0]
+            self.source_done = False
+        else:
+            self.sf.seek(self.read_frame)
+
+    def reconfigure(self, samplerate, blocksize):
+        with self.fill_lock:
+            if samplerate != self.jack_frame_rate:
+                # everything buffered was resampled for the old rate, continue from the same spot at the new one
+                position = round(self.read_frame * samplerate / self.jack_frame_rate)
+                self.loop_buffer = None  # read at the old rate
+                self._use_samplerate(samplerate)
+                self._reposition(position)
+            if blocksize != self.jack_block_size:
+                # JACK doesn't run the process callback while the period size changes, so the ring can be swapped
+                # out from under it, keeping what's buffered
+                self.ring.resize(self.max_buffer_size * blocksize)
+                self.ring.depth = self.tuner.depth * blocksize
+                self.on_frame = self.on_frame * self.jack_block_size // blocksize
+
+            self.jack_block_size = blocksize
+            self.frame_rate = samplerate / blocksize
+            self.total_frames = math.ceil(self.frames / blocksize)
+            super().reconfigure(samplerate, blocksize)
+            self._fill()
+
+    @realtime
+    def pause(self):
+        super().pause()
+        self._forget_underruns()
+
+    @realtime
+    def _forget_underruns(self):
+        # running dry around a stop or while the ring refills after a seek says nothing about keeping up with playback
+        self.seen_underruns = self.ring.underruns
+        self.ring.min_fill = self.ring.fill()
+
+    def _tune(self):
+        now = time.perf_counter()
+        if not self.tuner.due(now):
+            return
+        starved = self.ring.underruns > self.seen_underruns
+        self.seen_underruns = self.ring.underruns
+        depth = self.tuner.update(now, starved, self.ring.min_fill / self.jack_block_size)
+        self.ring.min_fill = self.ring.fill()
+        if depth != self.buffer_size:
+            Log.debug(f"{self.name} buffers {depth} blocks now instead of {self.buffer_size}")
+            self.buffer_size = depth
+            self.ring.depth = depth * self.jack_block_size
 
     def frame(self):
-        data = self.block_generator.__next__()
-        if data is None:
-            self.stop()  # Playback is finished
-        else:
-            for channel, port in zip(data.T, self.client.outports):
-                port.get_array()[:] = channel
+        if self.ring.served != self.ring.wanted and self.seek_requested == -1:
+            # a seek came in while the last one was being taken over, the ring stays silent until it's done
+            self.seek(self.on_frame, self.on_frame)
+        self.fill()
+        self._tune()
 
     def pause_frame(self):
-        pass  # do nothing on pause frame
+        self.fill()  # keep the ring topped up while paused
+
+    def stop(self):
+        super().stop()
+        self.mixer.remove(self)
+        METRICS.remove_gauge(f"{self.name}.ring")  # the gauge would keep a retired player and its ring alive
 
 
 class Video(AbstractPlayer):
 
-    def __init__(self, client, video_file_name):
+    @staticmethod
+    def open_source(video_file_name):
+        """
+        Opens a video file for a Video player. Opencv only gets imported once a session actually has video.
+        """
+        import cv2.cv2 as cv2
+        return cv2.VideoCapture(video_file_name)
 
-        self.vcap = cv2.VideoCapture(video_file_name)
+    def __init__(self, client, video_file_name, size=(480, 360), buffer_size=8, burn_in=False, frame_cache=None,
+                 cache_frames=24, process=False, presenter=None, source=None, min_buffer_size=2):
+        # these all pull in opencv
+        import cv2.cv2 as cv2
+        from musejack.decoder import Decoder, RemoteDecoder
+        from musejack.overlays import TimecodeOverlay
+
+        self.video_file_name = video_file_name
+        self.vcap = source if source is not None else Video.open_source(video_file_name)
 
         super().__init__(client=client, frame_rate=round(self.vcap.get(cv2.CAP_PROP_FPS)),
                          total_frames=round(self.vcap.get(cv2.CAP_PROP_FRAME_COUNT)), )
+        self.name = f"video:{Path(video_file_name).name}"
+
+        # the decode thread runs ahead of the transport and fills this ring with frames that are already scaled,
+        # either decoding them itself or by handing them to a worker process that writes into shared memory
+        self.size = size
+        shape = (buffer_size, size[1], size[0], 3)
+        if process:
+            self.vcap.release()
+            self.decoder = RemoteDecoder(video_file_name, shape, self.frame_rate)
+        else:
+            self.decoder = Decoder(video_file_name, np.zeros(shape, dtype=np.uint8), self.frame_rate, self.vcap)
+        self.ring = FrameRing(buffer_size, shape[1:], frames=self.decoder.frames)
+        # how far the decoder runs ahead is tuned to the decode jitter, up to buffer_size frames
+        self.tuner = DepthTuner(buffer_size, min_buffer_size, buffer_size)
+        self.late_frames = 0  # frames missed while playing steadily, not because of a seek
+        self.seen_late_frames = 0
+        self.decode_thread = Thread(target=self._decode_loop, daemon=True)
+        METRICS.gauge(f"{self.name}.ring", lambda: self.ring.count)
+
+        self.burn_in = TimecodeOverlay(self.frame_rate) if burn_in else None
+
+        # shows the frames, usually shared by every video of a timeline; on its own a video shows them in a window
+        self.owns_presenter = presenter is None
+        if self.owns_presenter:
+            from musejack.presenter import Presenter
+            presenter = Presenter()
+            presenter.start()
+        self.presenter = presenter
+        self.presented = 0
 
         # we keep the last frame drawn in memory for pausing
-        self.last_frame = None
-
+        self.last_frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        self.has_last_frame = False
+
+        # next frame that goes into the ring, only touched by the decode thread
+        self.decode_frame = 0
+        self.seek_latency = 0.0
+        self.seek_started = None
+        self.skipped_decodes = 0  # frames the decoder skipped because the presentation was already past them
+
+        # the first cache_frames frames after every seek target are kept in the shared frame cache, so relocating to
+        # the same spot again doesn't need to decode
+        self.frame_cache = frame_cache
+        self.cache_frames = cache_frames
+        self.cache_until = 0
+
+        # proxy to switch to, picked up by the decode thread
+        self.pending_source = None
+
+        self.decoder.start()
+        self.decode_thread.start()
         # we always need to call this start loop at the end of the __init__ method
         self.start()
 
-    def seek(self, oldPos, newPos):
-        self.vcap.set(cv2.CAP_PROP_POS_FRAMES, newPos)
-
-    def frame(self):
-        ret, frame = self.vcap.read()
-        if ret:
-            # Display the resulting frame
-            if self.text:
-                self.text.draw(frame)
+    def use_proxy(self, path, keyframes):
+        """
+        Switches decoding over to a low resolution proxy of the source, the decode thread picks it up before its next
+        frame. The source stays the fallback if the proxy can't be opened.
+        """
+        self.pending_source = (path, keyframes)
 
-                if self.text.done():
-                    self.text = None
+    def _decode_loop(self):
+        decoder = f"{self.name}.decoder"
+        while True:
+            METRICS.mark(decoder, "idle")
+            slot, generation, seek = self.ring.reserve()
+            if slot is None:
+                return  # ring closed, player stopped
+
+            if self.pending_source is not None:
+                path, keyframes = self.pending_source
+                self.pending_source = None
+                if self.decoder.use_source(path, keyframes):
+                    Log.info(f"{self.name} now plays from proxy {path}")
+
+            if seek != -1:
+                self.seek_started = time.perf_counter()
+                self.decode_frame = seek
+                self.cache_until = seek + self.cache_frames
+            elif self.decode_frame < self.on_frame:
+                # the presentation already dropped these frames, don't spend time decoding and scaling them
+                self.skipped_decodes += self.on_frame - self.decode_frame
+                self.decode_frame = self.on_frame
+
+            target = self.ring.frames[slot]
+            loop = self.loop_buffer
+            cached = loop is not None and loop.get_into(self.decode_frame, target)
+            # only frames right after a seek target ever get cached, past those a lookup is just a miss
+            in_cache_window = self.frame_cache is not None and self.decode_frame < self.cache_until
+            if not cached and in_cache_window:
+                cached = self.frame_cache.get_into(self.video_file_name, self.decode_frame, target)
+            if not cached:
+                METRICS.mark(decoder, "decode")
+                decoded, decode_time, resize_time = self.decoder.decode(slot, self.decode_frame)
+                if not decoded:
+                    self.ring.finish(generation)
+                    continue
+                DECODE_TIME.record(decode_time)
+                RESIZE_TIME.record(resize_time)
+
+                if in_cache_window:
+                    self.frame_cache.put(self.video_file_name, self.decode_frame, target)
+
+            if self.seek_started is not None:
+                self.seek_latency = time.perf_counter() - self.seek_started
+                self.seek_started = None
+                VIDEO_SEEK_TIME.record(self.seek_latency)
+                Log.debug(f"seek to frame {self.decode_frame} took {self.seek_latency * 1000:.1f} ms"
+                          f"{' (cached)' if cached else ''}")
+
+            self.ring.commit(slot, self.decode_frame, generation)
+            self.decode_frame += 1
 
-            frameS = cv2.resize(frame, (480, 360), fx=0, fy=0, interpolation=cv2.INTER_CUBIC)
-            cv2.imshow("output", frameS)
+    def seek(self, oldPos, newPos):
+        self.ring.seek(newPos)
 
-            # save the frame
-            self.last_frame = frameS
-            if cv2.waitKey(1):  # we need this for
-                return
+    def frame(self):
+        # give the decoder at most one frame period to catch up, otherwise we skip this frame
+        slot = self.ring.peek(self.on_frame, timeout=1 / self.frame_rate)
+        self._tune()
+        if slot is None:
+            self.sync.missed += 1
+            if self.seek_started is None and self.ring.pending_seek == -1:
+                self.late_frames += 1
+            return
+
+        self._present(slot)
+
+    def locate_frame(self):
+        # the stopped transport got moved, show the frame there without starting to play
+        slot = self.ring.peek(self.on_frame, timeout=LOCATE_TIMEOUT)
+        if slot is None:
+            self.pause_frame()
+            return
+        self._present(slot)
+
+    def _present(self, slot):
+        frame = self.ring.frames[slot]
+        start = time.perf_counter()
+        METRICS.mark(self.name, "overlay")
+        if self.text:
+            self.text.draw(frame)
+
+            if self.text.done():
+                self.text = None
+        if self.burn_in:
+            self.burn_in.draw(frame, self.on_frame)
+        OVERLAY_TIME.record(time.perf_counter() - start)
+
+        METRICS.mark(self.name, "present")
+        self.presenter.submit(frame, self)
+        self.presented += 1
+
+        # save the frame, the slot gets reused by the decoder once released
+        np.copyto(self.last_frame, frame)
+        self.has_last_frame = True
+        self.ring.release()
+        METRICS.mark(self.name, "idle")
+
+    def _tune(self):
+        now = time.perf_counter()
+        if not self.tuner.due(now):
+            return
+        starved = self.late_frames > self.seen_late_frames
+        self.seen_late_frames = self.late_frames
+        depth = self.tuner.update(now, starved, self.ring.min_count)
+        if depth != self.ring.depth:
+            Log.debug(f"{self.name} decodes {depth} frames ahead now instead of {self.ring.depth}")
+        self.ring.set_depth(depth)
 
     def pause_frame(self):
-        if self.last_frame:
-            cv2.imshow("output", self.last_frame)
-
-            if cv2.waitKey(1):  # we need this for
-                return
+        # the presenter keeps showing what it got last, unless another video took over our screen meanwhile
+        if self.has_last_frame and not self.presenter.showing(self):
+            self.presenter.submit(self.last_frame, self)
 
     def stop(self):
-        self.vcap.release()
-        cv2.destroyAllWindows()
+        super().stop()
+        METRICS.remove_gauge(f"{self.name}.ring")
+        self.ring.close()
+        self.decode_thread.join()
+        self.decoder.close()
+        if self.owns_presenter:
+            self.presenter.stop()
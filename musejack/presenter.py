@@ -0,0 +1,172 @@
+import logging
+import time
+from threading import Event, Lock, Thread
+
+import cv2
+import numpy as np
+
+from musejack.display import OffscreenSink, WindowSink
+from musejack.metrics import METRICS
+
+Log = logging.getLogger(__name__)
+
+SHOW_TIME = METRICS.histogram("video.imshow")
+
+
+class Screen:
+    """
+    Where the frames of one video end up: its sinks, and the triple buffer between its player and the presenter.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+        # the player writes into back, the newest complete frame waits in ready, the presenter shows front
+        self.back = None
+        self.ready = None
+        self.front = None
+        self.lock = Lock()
+        self.submit_lock = Lock()
+        self.fresh = False
+        self.source = None  # player of the newest frame
+
+
+class Presenter(Thread):
+    """
+    Owns every display sink and shows the frames the Video players hand over, paced at the refresh rate of the display.
+
+    HighGUI wants its windows created, painted and polled from a single thread, and a slow imshow shouldn't hold up the
+    player that has to be ready for its next frame boundary. So players only copy their frame into a triple buffer
+    here and go back to waiting; once per refresh this thread picks up the newest complete frame, if there is one, and
+    shows it on every sink, scaled to the sink's size. Nothing new (paused, or between two video frames) means nothing
+    gets painted, the windows keep what they show.
+
+    Videos that play at the same time (a cue group, see assign) each get a screen of their own: the first one the
+    sinks, every other one a window named after it, so they don't take turns in the same window.
+    """
+
+    def __init__(self, sinks=None, refresh=60.0):
+        super().__init__(daemon=True, name="presenter")
+        self.main = Screen(list(sinks) if sinks else [WindowSink()])
+        self.extra = {}  # player -> Screen of the videos next to the first one of the group
+        self.assigned = ()  # videos of the playing group, the first one gets the main screen
+        self.refresh = refresh
+        self.repaint = False
+
+        # sinks with a size of their own get the frame scaled into these
+        self.scaled = {}
+        self.windows = any(isinstance(sink, WindowSink) for sink in self.main.sinks)
+        self.stopped = Event()
+        self.shown = 0
+        self.superseded = 0  # frames replaced by a newer one before they were shown
+
+    def assign(self, videos):
+        """
+        Tells which videos play together now, the first one goes to the main screen. Called from the realtime path.
+        """
+        self.assigned = tuple(videos)
+
+    def _screen(self, source):
+        assigned = self.assigned
+        if not assigned or source is None or source is assigned[0]:
+            return self.main
+        if not any(source is video for video in assigned):
+            return None  # not playing anymore, it doesn't get to overwrite anything
+        screen = self.extra.get(source)
+        if screen is None:
+            size = self.main.sinks[0].size
+            sink = WindowSink(source.name, size) if self.windows else OffscreenSink(size)
+            screen = self.extra[source] = Screen([sink])
+        return screen
+
+    def submit(self, frame, source=None):
+        """
+        Hands a frame over to be shown on the next refresh, copying it so the caller can reuse its buffer right away.
+        Called from the player threads.
+        """
+        screen = self._screen(source)
+        if screen is None:
+            return
+        with screen.submit_lock:
+            if screen.back is None or screen.back.shape != frame.shape:
+                screen.back = np.empty_like(frame)
+            np.copyto(screen.back, frame)
+            with screen.lock:
+                screen.back, screen.ready = screen.ready, screen.back
+                if screen.fresh:
+                    self.superseded += 1
+                screen.fresh = True
+                screen.source = source
+
+    def showing(self, source) -> bool:
+        """
+        Whether the screen of source shows a frame of it, and not of another video that took it over.
+        """
+        screen = self._screen(source)
+        return screen is not None and screen.source is source
+
+    def show_again(self):
+        """
+        Shows the last frame again on the next refresh, e.g. after a window got covered.
+        """
+        self.repaint = True
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        period = 1 / self.refresh
+        deadline = time.perf_counter()
+        while not self.stopped.is_set():
+            repaint, self.repaint = self.repaint, False
+            for screen in [self.main, *self._current_extra()]:
+                with screen.lock:
+                    fresh = screen.fresh
+                    if fresh:
+                        screen.ready, screen.front = screen.front, screen.ready
+                        screen.fresh = False
+                if fresh or (repaint and screen.front is not None):
+                    self._show(screen.sinks, screen.front)
+            if self.windows:
+                cv2.waitKey(1)  # imshow only paints while the HighGUI event loop runs, and windows need their events
+
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.perf_counter()  # fell behind, don't rush the next refreshes to catch up
+
+        for screen in [self.main, *self.extra.values()]:
+            self._close(screen)
+
+    def _current_extra(self) -> list:
+        # windows of videos that stopped playing next to the first one get closed, from this thread as HighGUI wants
+        assigned = self.assigned
+        for source in list(self.extra):
+            if not any(source is video for video in assigned[1:]):
+                self._close(self.extra.pop(source))
+        return list(self.extra.values())
+
+    def _close(self, screen):
+        for sink in screen.sinks:
+            self.scaled.pop(sink, None)
+            sink.close()
+
+    def _show(self, sinks, frame):
+        start = time.perf_counter()
+        for sink in sinks:
+            if sink.size is None or sink.size == (frame.shape[1], frame.shape[0]):
+                sink.show(frame)
+                continue
+            shape = (sink.size[1], sink.size[0], frame.shape[2])
+            scaled = self.scaled.get(sink)
+            if scaled is None or scaled.shape != shape:
+                scaled = self.scaled[sink] = np.empty(shape, dtype=frame.dtype)
+            shrink = sink.size[0] < frame.shape[1]
+            cv2.resize(frame, sink.size, dst=scaled, interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+            sink.show(scaled)
+        self.shown += 1
+        SHOW_TIME.record(time.perf_counter() - start)
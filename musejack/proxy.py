@@ -0,0 +1,73 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+
+from musejack.keyframes import KeyframeIndex
+from musejack.util import atomic_write, file_fingerprint
+
+Log = logging.getLogger(__name__)
+
+PROXY_DIR = ".musejack_proxies"
+
+
+class ProxyBuilder:
+    """
+    Builds low resolution, intra-only (MJPEG) copies of video files in a background pool.
+
+    Proxies are cached in a folder next to the .mjck file, keyed by the fingerprint of the source and the proxy size,
+    so every file only gets transcoded once.
+    """
+
+    def __init__(self, directory, size=(480, 360), workers=2):
+        self.directory = Path(directory).joinpath(PROXY_DIR)
+        self.size = size
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="proxy")
+
+    def proxy_path(self, source) -> Path:
+        source = Path(source)
+        width, height = self.size
+        return self.directory.joinpath(f"{source.stem}-{file_fingerprint(source)[:12]}-{width}x{height}.avi")
+
+    def request(self, source, ready):
+        """
+        Calls ready(proxy_path, keyframes) from a pool thread once the proxy of source exists.
+        """
+        return self.pool.submit(self._build, source, ready)
+
+    def _build(self, source, ready):
+        try:
+            proxy = self.proxy_path(source)
+            if not proxy.exists():
+                self.transcode(source, proxy)
+            ready(str(proxy), KeyframeIndex.open(proxy))
+        except Exception as e:
+            # the source keeps working, so a failed proxy is not fatal
+            Log.warning(f"Couldn't build a proxy for {source}: {e}")
+
+    def transcode(self, source, proxy):
+        start = time.perf_counter()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with atomic_write(proxy) as tmp:
+            vcap = cv2.VideoCapture(str(source))
+            writer = cv2.VideoWriter(str(tmp), cv2.VideoWriter_fourcc(*"MJPG"), vcap.get(cv2.CAP_PROP_FPS), self.size)
+            try:
+                if not vcap.isOpened() or not writer.isOpened():
+                    raise OSError(f"can't transcode {source} to {tmp}")
+
+                scaled = None
+                while True:
+                    ret, frame = vcap.read()
+                    if not ret:
+                        break
+                    scaled = cv2.resize(frame, self.size, dst=scaled, interpolation=cv2.INTER_AREA)
+                    writer.write(scaled)
+            finally:
+                vcap.release()
+                writer.release()
+        Log.info(f"Built proxy {proxy} in {time.perf_counter() - start:.1f} s")
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
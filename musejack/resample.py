@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+
+
+class Resampler:
+    """
+    Streaming polyphase resampler with a windowed-sinc filter.
+
+    Every call converts a whole block at once: the input windows of all output samples are gathered in one go and
+    multiplied with the filter phase belonging to each output sample, there are no per sample Python loops.
+    """
+
+    def __init__(self, source_rate, target_rate, channels, taps=32, rolloff=0.97):
+        g = math.gcd(int(source_rate), int(target_rate))
+        self.up = int(target_rate) // g
+        self.down = int(source_rate) // g
+        self.taps = taps
+        self.channels = channels
+
+        # lowpass at the lowest of both nyquist frequencies, designed at the upsampled rate
+        length = taps * self.up
+        self.delay = length // 2
+        cutoff = min(1.0, self.up / self.down) * rolloff
+        m = np.arange(length)
+        h = np.sinc(cutoff * (m - self.delay) / self.up) * np.blackman(length)
+        h *= self.up / h.sum()  # unity gain for every phase
+
+        # bank[phase, k] = h[k * up + phase]
+        self.bank = np.ascontiguousarray(h.reshape(taps, self.up).T, dtype=np.float32)
+        self.offsets = np.arange(taps)
+
+        self.reset()
+
+    def reset(self):
+        # history of input samples, buffer[0] is input sample number offset
+        self.buffer = np.zeros((self.taps, self.channels), dtype=np.float32)
+        self.offset = -self.taps
+        self.consumed = 0  # input samples seen since the last reset
+        self.produced = 0  # output samples produced since the last reset
+
+    def output_length(self, input_length) -> int:
+        return math.ceil(input_length * self.up / self.down)
+
+    def process(self, block, final=False) -> np.ndarray:
+        """
+        Converts a block shaped (frames, channels) and returns every output sample that can be computed so far.
+        Pass final=True with the last block to flush the tail of the filter.
+        """
+        self.consumed += len(block)
+        buffer = np.concatenate((self.buffer, block.astype(np.float32, copy=False)))
+        end = self.offset + len(buffer)
+
+        # output n needs the input samples up to (n * down + delay) // up
+        last = (end * self.up - 1 - self.delay) // self.down
+        if final:
+            buffer = np.concatenate((buffer, np.zeros((self.taps, self.channels), dtype=np.float32)))
+            last = self.output_length(self.consumed) - 1
+
+        n = np.arange(self.produced, last + 1)
+        u = n * self.down + self.delay
+        windows = buffer[(u // self.up - self.offset)[:, None] - self.offsets[None, :]]
+        out = np.einsum("nk,nkc->nc", self.bank[u % self.up], windows)
+        self.produced = max(self.produced, last + 1)
+
+        # keep only the history the next output sample still needs
+        keep = max(0, (self.produced * self.down + self.delay) // self.up - self.taps + 1 - self.offset)
+        self.buffer = buffer[keep:]
+        self.offset += keep
+        return out
@@ -0,0 +1,35 @@
+from musejack.metrics import METRICS
+
+DRIFT = METRICS.histogram("sync.drift", scale=1, unit=" frames")
+
+
+class SyncController:
+    """
+    Keeps a player locked to the transport. Every wakeup it compares the frame the player would present next with the
+    frame the transport expects, and picks the next frame to present: the expected one when we are late (dropping
+    everything in between), the same one again when we are early (holding). The drift gets recorded into histogram,
+    if there is one.
+    """
+
+    def __init__(self, histogram=DRIFT):
+        self.histogram = histogram
+        self.drift = 0  # expected - next frame, in frames, positive means the picture is late, 0 when in sync
+        self.dropped = 0
+        self.held = 0
+        self.missed = 0  # frames that weren't decoded in time to be presented
+
+    def next_frame(self, presented, expected) -> int:
+        self.drift = expected - (presented + 1)
+        if self.histogram is not None:
+            self.histogram.record(abs(self.drift))
+
+        if self.drift > 0:
+            self.dropped += self.drift
+            return expected
+        if self.drift < 0:
+            self.held += 1
+            return presented
+        return presented + 1
+
+    def reset(self):
+        self.drift = 0
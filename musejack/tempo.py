@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class TempoMap:
+    """
+    Piecewise constant tempo of a score, as the (tick, seconds, tempo) breakpoints the MuseJack plugin exports.
+
+    Between two breakpoints time runs linearly with the ticks, so converting ticks to seconds is a binary search for
+    the breakpoint and one multiply-add, done for a whole numpy array of ticks at once (times_at).
+    """
+
+    def __init__(self, ticks, seconds, tempos, division=480):
+        self.division = division  # ticks per quarter note
+        self.ticks = np.asarray(ticks, dtype=np.int64)
+        self.seconds = np.asarray(seconds, dtype=np.float64)
+        self.tempos = np.asarray(tempos, dtype=np.float64)  # quarter notes per second
+
+        if not len(self.ticks):
+            raise ValueError("A tempo map needs at least one breakpoint")
+        if np.any(np.diff(self.ticks) <= 0):
+            raise ValueError("Tempo map breakpoints must be sorted by tick")
+
+        # ticks per second of every segment
+        self.rates = self.tempos * division
+
+    @staticmethod
+    def from_mjck(data):
+        """
+        Tempo map of a parsed .mjck file, None for files written before the plugin exported one.
+        """
+        breakpoints = data.get("tempoMap")
+        if not breakpoints:
+            return None
+        return TempoMap([point["tick"] for point in breakpoints],
+                        [float(point["time"]) for point in breakpoints],
+                        [float(point["tempo"]) for point in breakpoints],
+                        int(data.get("division", 480)))
+
+    def times_at(self, ticks: np.ndarray) -> np.ndarray:
+        """
+        Seconds from the start of the score to every tick. Ticks before the first breakpoint use its tempo.
+        """
+        i = np.maximum(np.searchsorted(self.ticks, ticks, side="right") - 1, 0)
+        return self.seconds[i] + (ticks - self.ticks[i]) / self.rates[i]
@@ -0,0 +1,330 @@
+import json
+import logging
+import time
+from bisect import bisect_right
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+
+from musejack.mixer import Mixer
+from musejack.players import Audio, Video, realtime
+from musejack.tempo import TempoMap
+from musejack.util import parse_time
+
+Log = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = {".wav", ".flac", ".mp3", ".ogg", ".aif", ".aiff"}
+
+# end of the last cue, in JACK frames
+FOREVER = 1 << 62
+
+
+class Cue:
+
+    def __init__(self, path, time, media_time):
+        self.path = path
+        self.time = time  # position in the score, in seconds
+        self.media_time = media_time  # position in the media file where playback starts, in seconds
+
+    def key(self):
+        return self.path, self.time, self.media_time
+
+
+class Timeline:
+    """
+    Sorted, array backed index of the cue points of a .mjck file.
+
+    Every cue is active from its own start until the start of the next cue, so resolving the active cue for a JACK
+    frame is a binary search over the start frames. Cues that start at the same time form a group and play together,
+    e.g. the picture and its dialogue, music and FX stems.
+    """
+
+    def __init__(self, cues, samplerate, directory="."):
+        self.samplerate = samplerate
+        self.directory = Path(directory)  # folder of the .mjck file, caches go next to it
+
+        self.cues, self.starts, self.offsets, self.paths, self._starts, self._offsets, self._firsts = self._index(cues)
+
+        self.players = {}  # one player per media file, shared by every cue using that file
+        self.player_options = None  # how open_players opened them, players for new media get opened the same way
+        self.mixer = None  # output bus every audio player feeds, created by open_players
+        self.presenter = None  # display thread every video player feeds, created with the first one
+        self.clock = None  # TransportClock of a Follower, when following the transport
+        self.active = -1
+
+        # index built by update, swapped in by the realtime callback so it never sees half of an update
+        self.pending = None
+        self.rolling = False
+        self.swap_lock = Lock()  # an idle swap (see update) may race the callback starting the transport
+        self.transport_frame = 0
+
+        # boundaries of the active cue, so step only has to search when the transport leaves them
+        self.active_start = 0
+        self.active_end = -1
+        self.active_group = ()  # (player, delta) of every cue in the active group, the active cue last
+
+    def _index(self, cues):
+        cues = sorted(cues, key=lambda cue: cue.time)
+        starts = np.array([round(cue.time * self.samplerate) for cue in cues], dtype=np.int64)
+        offsets = np.array([round(cue.media_time * self.samplerate) for cue in cues], dtype=np.int64)
+        paths = [cue.path for cue in cues]
+
+        # first cue of the group every cue belongs to
+        firsts = []
+        for i in range(len(cues)):
+            firsts.append(firsts[i - 1] if i and starts[i] == starts[i - 1] else i)
+
+        # plain lists for the realtime path, bisect on them doesn't go through numpy
+        return cues, starts, offsets, paths, starts.tolist(), offsets.tolist(), firsts
+
+    @staticmethod
+    def read(mjck_path):
+        """
+        Cues of a .mjck file, timed with its tempo map when it has one.
+        """
+        mjck_path = Path(mjck_path)
+        with open(mjck_path) as f:
+            data = json.load(f)
+
+        points = data.get("points", [])
+        tempo_map = TempoMap.from_mjck(data)
+        if tempo_map is not None and all("tick" in point for point in points):
+            # the tempo map is exact, msTime only approximates it
+            times = tempo_map.times_at(np.array([point["tick"] for point in points], dtype=np.int64)).tolist()
+        else:
+            # the plugin writes msTime in seconds
+            times = [float(point["msTime"]) for point in points]
+
+        cues = []
+        for point, time in zip(points, times):
+            # relative media paths are relative to the .mjck file
+            path = mjck_path.parent.joinpath(point["path"])
+            cues.append(Cue(str(path), time, parse_time(point.get("videoTime", 0))))
+        return cues
+
+    @staticmethod
+    def load(mjck_path, samplerate):
+        cues = Timeline.read(mjck_path)
+        Log.info(f"Loaded {len(cues)} cue points from {mjck_path}")
+        return Timeline(cues, samplerate, Path(mjck_path).parent)
+
+    def open_players(self, client, proxies=None, burn_in=False, frame_cache=None, pcm_cache=False, process=False,
+                     sinks=None, size=(480, 360), refresh=60.0, workers=8):
+        """
+        Opens a player for every media file. With a ProxyBuilder, videos switch to their proxy once it's built.
+        With pcm_cache, audio files get decoded (and resampled) once into a memory mapped cache. With process, every
+        video decodes in a worker process. Videos get decoded at size and shown on sinks, or in a window, at refresh
+        frames per second at most.
+
+        Opening the files (probing containers, initialising codecs) is most of the work, so that runs on up to workers
+        threads at once. The players are then created one after another, so their JACK ports get registered in order.
+        """
+        self.player_options = (client, proxies, burn_in, frame_cache, pcm_cache, process, sinks, size, refresh)
+        if self.mixer is None:
+            # right away, even without audio yet: JACK only takes a process callback before the client gets activated,
+            # and only ports registered by then get connected, while a reload may add the first audio player later
+            self.mixer = Mixer(client)
+        paths = [path for path in dict.fromkeys(self.paths) if path not in self.players]
+        if not paths:
+            return list(self.players.values())
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(workers, len(paths)), thread_name_prefix="probe") as pool:
+            sources = list(pool.map(self._open_source, paths))
+        probed = time.perf_counter()
+
+        for path, (source, seconds) in zip(paths, sources):
+            Log.debug(f"Opened {path} in {seconds * 1000:.0f} ms")
+            self.players[path] = self._open_player(path, source)
+
+        slowest = max(range(len(paths)), key=lambda i: sources[i][1])
+        Log.info(f"Opened {len(paths)} media files in {time.perf_counter() - start:.2f} s: probing "
+                 f"{probed - start:.2f} s (slowest {Path(paths[slowest]).name} {sources[slowest][1]:.2f} s), "
+                 f"players {time.perf_counter() - probed:.2f} s")
+        return list(self.players.values())
+
+    @staticmethod
+    def _open_source(path):
+        start = time.perf_counter()
+        if Path(path).suffix.lower() in AUDIO_EXTENSIONS:
+            source = Audio.open_source(path)
+        else:
+            source = Video.open_source(path)
+        return source, time.perf_counter() - start
+
+    def _open_player(self, path, source=None):
+        player = self._create_player(path, source)
+        player.clock = self.clock
+        return player
+
+    def _create_player(self, path, source=None):
+        client, proxies, burn_in, frame_cache, pcm_cache, process, sinks, size, refresh = self.player_options
+        if Path(path).suffix.lower() in AUDIO_EXTENSIONS:
+            return Audio(client, path, pcm_cache=pcm_cache, source=source, mixer=self.mixer)
+        if self.presenter is None:
+            from musejack.presenter import Presenter  # pulls in opencv
+            self.presenter = Presenter(sinks, refresh)
+            self.presenter.start()
+        player = Video(client, path, size=size, burn_in=burn_in, frame_cache=frame_cache, process=process,
+                       presenter=self.presenter, source=source)
+        if proxies is not None:
+            proxies.request(path, player.use_proxy)
+        return player
+
+    def set_clock(self, clock):
+        """
+        Lets every player, also the ones opened later, extrapolate the transport with clock.
+        """
+        self.clock = clock
+        players = self.pending[7] if self.pending is not None else {}
+        for player in {**self.players, **players}.values():
+            player.clock = clock
+
+    def update(self, cues) -> list:
+        """
+        Applies a new set of cues, e.g. from a rewritten .mjck. Players of media that is still used are kept with their
+        open files and warm caches, only new media gets opened. The new index goes live on the next JACK cycle, or
+        right away while the transport is stopped, as no cycle might come to pick it up then.
+
+        Returns the players that are no longer used, to be stopped once the update is live (pending is None again).
+        """
+        pending = self.pending
+        old = Counter(cue.key() for cue in (pending[0] if pending is not None else self.cues))
+        new = Counter(cue.key() for cue in cues)
+        if old == new:
+            return []
+
+        index = self._index(cues)
+        known = {**self.players, **pending[7]} if pending is not None else self.players
+        players = {}
+        opened = 0
+        for path in dict.fromkeys(index[3]):
+            players[path] = known.get(path)
+            if players[path] is None:
+                players[path] = self._open_player(path)
+                opened += 1
+        # the realtime path keeps using the old players until the swap
+        retired = [player for path, player in known.items() if path not in players]
+
+        Log.info(f"Updating cues: {sum((new - old).values())} added, {sum((old - new).values())} removed, "
+                 f"{opened} players opened, {len(retired)} closed")
+        self.pending = (*index, players)
+        if not self.rolling:
+            self._swap(idle=True)
+        return retired
+
+    def reconfigure(self, samplerate, blocksize):
+        """
+        Follows a change of the JACK samplerate or period size. The cue positions get recomputed for a new samplerate
+        and go live like an update, every player resizes its buffers and timing.
+        """
+        pending = self.pending
+        players = pending[7] if pending is not None else self.players
+        if samplerate != self.samplerate:
+            cues = pending[0] if pending is not None else self.cues
+            self.transport_frame = round(self.transport_frame * samplerate / self.samplerate)
+            self.samplerate = samplerate
+            self.pending = (*self._index(cues), players)
+        if self.mixer is not None:
+            self.mixer.set_blocksize(blocksize)
+        for player in {**self.players, **players}.values():
+            player.reconfigure(samplerate, blocksize)
+
+    def resolve(self, jack_frame) -> int:
+        """
+        Index of the cue active at jack_frame, or -1 before the first cue.
+        """
+        return bisect_right(self._starts, jack_frame) - 1
+
+    def resolve_many(self, jack_frames: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.starts, jack_frames, side="right") - 1
+
+    def group(self, index) -> range:
+        """
+        Indices of the cues that play together with cue index, it included, empty for -1.
+        """
+        return range(self._firsts[index], index + 1) if index >= 0 else range(0)
+
+    def media_frame(self, index, jack_frame) -> int:
+        """
+        Position inside the media of cue index, in JACK frames.
+        """
+        return jack_frame - self._starts[index] + self._offsets[index]
+
+    @realtime
+    def seek(self, jack_frame):
+        if self.pending is not None:
+            self._swap()
+        self.rolling = True
+        self.transport_frame = jack_frame
+        self._switch(self.resolve(jack_frame))
+        for player, delta in self.active_group:
+            player._seek(jack_frame + delta)
+
+    @realtime
+    def locate(self, jack_frame):
+        """
+        Moves the players to jack_frame but leaves them paused, for relocates while the transport is stopped.
+        """
+        if self.pending is not None:
+            self._swap()
+        self.transport_frame = jack_frame
+        self._switch(self.resolve(jack_frame))
+        for player, delta in self.active_group:
+            player._seek(jack_frame + delta, play=False)
+
+    @realtime
+    def step(self, jack_frame):
+        if not self.rolling:
+            # only seek starts the players, stepping a stopped timeline must not (that would play the stems)
+            self.transport_frame = jack_frame
+            return
+        if self.pending is not None:
+            self._swap()
+        self.transport_frame = jack_frame
+        if not self.active_start <= jack_frame < self.active_end:
+            # we left the active cue (or rolled into the first one)
+            self.seek(jack_frame)
+        else:
+            for player, delta in self.active_group:
+                player._step(jack_frame + delta)
+
+    @realtime
+    def pause(self):
+        self.rolling = False
+        for player, _ in self.active_group:
+            player.pause()
+
+    @realtime
+    def _swap(self, idle=False):
+        # only ever contended by an idle swap, which is done in a moment
+        with self.swap_lock:
+            if self.pending is None or idle and self.rolling:
+                return  # the other side swapped already, or the transport started and the callback will
+            (self.cues, self.starts, self.offsets, self.paths, self._starts, self._offsets, self._firsts,
+             self.players) = self.pending
+            self.pending = None
+
+            # the cues under the transport might have moved, only seek the players whose position has to change
+            group = self.active_group
+            self._switch(self.resolve(self.transport_frame))
+            if self.rolling:
+                for player, delta in self.active_group:
+                    if (player, delta) not in group:
+                        player._seek(self.transport_frame + delta)
+
+    def _switch(self, index):
+        group = tuple((self.players[self.paths[i]], self._offsets[i] - self._starts[i]) for i in self.group(index))
+        for player, _ in self.active_group:
+            if not any(player is other for other, _ in group):
+                player.pause()
+
+        self.active = index
+        self.active_group = group
+        if self.presenter is not None:
+            self.presenter.assign(player for player, _ in group if isinstance(player, Video))
+        self.active_start = self._starts[index] if index >= 0 else -FOREVER
+        self.active_end = self._starts[index + 1] if index + 1 < len(self._starts) else FOREVER
@@ -1,5 +1,8 @@
+import hashlib
 import os
 import sys
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 
@@ -19,3 +22,88 @@ def resource_path(relative_path):
         return os.path.join(sys._MEIPASS,  relative_path) # executable with pyinstaller
     return os.path.join(os.path.abspath("../resources"), relative_path) # executing using python
 
+
+
+# only hash the start and end of a file, hashing a whole reel would take longer than the work we're caching
+HASH_CHUNK = 1 << 20
+
+
+def file_fingerprint(path) -> str:
+    """
+    Cheap fingerprint of a media file: size plus a hash of the first and last megabyte.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(HASH_CHUNK))
+        if size > HASH_CHUNK:
+            f.seek(max(HASH_CHUNK, size - HASH_CHUNK))
+            h.update(f.read(HASH_CHUNK))
+    return h.hexdigest()
+
+
+def cache_key(path, *parts) -> str:
+    """
+    Name of a cache built from the media file at path: its fingerprint and modification time, so an edited or replaced
+    file doesn't pick up the old cache, followed by parts.
+    """
+    return "-".join([file_fingerprint(path), str(int(os.path.getmtime(path))), *(str(part) for part in parts)])
+
+
+@contextmanager
+def atomic_write(path: Path):
+    """
+    Yields a temporary path next to path to write a cache into. It only gets its final name once the block completes,
+    so an interrupted build is never picked up as a complete cache; after an error it's removed.
+    """
+    tmp = path.with_name(path.stem + ".tmp" + path.suffix)  # keeps the extension, e.g. for cv2.VideoWriter
+    try:
+        yield tmp
+    except BaseException:
+        if tmp.exists():
+            os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+
+
+def cache_dir() -> Path:
+    """
+    Directory for caches that are too big to live next to the media files.
+    """
+    path = Path.home().joinpath(".musejack", "cache")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def parse_time(value) -> float:
+    """
+    Parses a time in seconds from a number or a "[hh:]mm:ss[.fff]" string.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    seconds = 0.0
+    for part in str(value).strip().split(":"):
+        seconds = seconds * 60 + float(part or 0)
+    return seconds
+
+
+class Stopwatch:
+    """
+    Times consecutive phases of something, e.g. startup.
+    """
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.laps = []
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.laps.append((name, now - self.last))
+        self.last = now
+
+    def total(self) -> float:
+        return self.last - self.start
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.laps)
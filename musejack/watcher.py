@@ -0,0 +1,77 @@
+import logging
+import os
+import time
+from threading import Event, Thread
+
+from musejack.timeline import Timeline
+
+Log = logging.getLogger(__name__)
+
+
+class MjckWatcher:
+    """
+    Watches a .mjck file and applies its cues to a running Timeline whenever the plugin rewrites it.
+
+    Polls the modification time and size, which costs one stat call per interval and works on every platform and
+    filesystem the plugin might write to.
+    """
+
+    def __init__(self, mjck_path, timeline: Timeline, interval=0.5, swap_timeout=2.0):
+        self.mjck_path = mjck_path
+        self.timeline = timeline
+        self.interval = interval
+        self.swap_timeout = swap_timeout
+        self.retired = []  # players of a reload whose cues didn't go live in time, stopped after a later one
+
+        self.signature = self._signature()
+        self.stopped = Event()
+        self.thread = Thread(target=self._watch_loop, daemon=True)
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.mjck_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _watch_loop(self):
+        while not self.stopped.wait(self.interval):
+            signature = self._signature()
+            if signature is None or signature == self.signature:
+                continue
+            try:
+                cues = Timeline.read(self.mjck_path)
+            except (OSError, ValueError, KeyError) as e:
+                # most likely caught the plugin halfway through writing, the next poll sees the whole file
+                Log.debug(f"Couldn't read {self.mjck_path} yet: {e}")
+                continue
+            self.signature = signature
+            self.reload(cues)
+
+    def reload(self, cues):
+        start = time.perf_counter()
+        retired = self.retired + self.timeline.update(cues)
+
+        # the realtime callback swaps the new cues in on its next cycle (update does it while stopped), after that
+        # nothing uses the retired players
+        deadline = time.perf_counter() + self.swap_timeout
+        while self.timeline.pending is not None and time.perf_counter() < deadline:
+            time.sleep(0.005)
+        if self.timeline.pending is not None:
+            Log.warning(f"The cues of {self.mjck_path} didn't go live within {self.swap_timeout} s, "
+                        f"keeping the players they retire until they do")
+            self.retired = retired
+        else:
+            live = self.timeline.players.values()
+            for player in retired:
+                if not any(player is other for other in live):  # a later reload may have taken it back
+                    player.stop()
+            self.retired = []
+        Log.info(f"Reloaded {self.mjck_path} in {(time.perf_counter() - start) * 1000:.1f} ms")
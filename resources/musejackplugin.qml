@@ -33,9 +33,13 @@ MuseScore {
             var track = 0;
             
             //tempo state keeping variables
-            var tempo = 80 / 60; //asume the first tempo chosen is 80 BPM
+            var tempo = 2; //in quarter notes per second, musescore plays at 120 BPM until the first tempo text
             var previousTempoTicks = 0; //in midi ticks
             var previousTempoTime = 0; //in SECONDS
+
+            //every tempo change as a (tick, time, tempo) breakpoint, so MuseJack can convert any tick to a time
+            outputs.division = division
+            outputs.tempoMap = [{tick: 0, time: 0, tempo: tempo}]
                       
             
             var segment = curScore.firstSegment();
@@ -52,6 +56,7 @@ MuseScore {
                                                       var point = {}
                                                       point.path = splits[1]
                                                       point.videoTime = splits[2]
+                                                      point.tick = segment.tick
                                                       
                                                       //calculation of MSTIME
                                                       var ticksSinceLastTempoChange = segment.tick - previousTempoTicks
@@ -67,8 +72,13 @@ MuseScore {
                                           
                                           tempo = element.tempo
                                           previousTempoTicks = segment.tick
-                                          
-                                          
+
+                                          var last = outputs.tempoMap[outputs.tempoMap.length - 1]
+                                          if (last.tick == segment.tick){
+                                                last.tempo = tempo //a later tempo text on the same tick wins
+                                          } else {
+                                                outputs.tempoMap.push({tick: segment.tick, time: previousTempoTime, tempo: tempo})
+                                          }
                                     }
                                }
                         }